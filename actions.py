@@ -0,0 +1,123 @@
+"""
+Serialized action executor
+
+Every Alt-key the engine sends, and every UDP control request (Reply,
+Configure), goes through one ActionQueue, drained on the loop thread one
+action at a time, so no two actions ever race for window focus.  Alt-N is
+a toggle, so TX changes are submitted as the state we want rather than as
+a keystroke: the engine decides only when the action runs whether Alt-N
+is needed at all, against the latest Status.
+
+Pending actions are coalesced as they are submitted:
+
+    a TX request for an instance replaces the one still pending for it
+    (enable, then disable before it ran: only "off" is left);
+    Alt-6 or Alt-H pending twice for the same instance is sent once, and
+    both submitters' on_done callbacks run (a plain Alt-N never is merged:
+    two toggles are not one);
+    cancel() drops an instance's pending actions when its state changes.
+
+The time each action waited in the queue and took to run is recorded per
+key in the metrics.
+"""
+
+import time
+from collections import deque
+
+import metrics
+
+IDEMPOTENT = ("6", "h")  # keys for which twice is the same as once
+
+ACTION_WAIT = metrics.registry.histogram(
+    "autotx73_action_wait_seconds", "Time actions waited in the queue", ("key",))
+ACTION_RUN = metrics.registry.histogram(
+    "autotx73_action_run_seconds", "Time actions took to run", ("key",))
+ACTIONS_DROPPED = metrics.registry.counter(
+    "autotx73_actions_dropped_total", "Actions not run: superseded, merged or cancelled", ("reason",))
+
+
+class Action:
+    """One queued action: Alt-`key`, or with `tx` set, Alt-N only if the
+    instance's TX state is not `tx` already; with `fields`, the backend's
+    `key` request ("reply", "configure") called with them."""
+    __slots__ = ("key", "tx", "label", "client_id", "on_done", "context", "fields", "submitted", "cancelled")
+
+    def __init__(self, key, label, client_id=None, tx=None, on_done=None, context=None, fields=None):
+        self.key = key
+        self.fields = fields
+        self.tx = tx
+        self.label = label
+        self.client_id = client_id
+        self.on_done = on_done  # called with the result once run
+        self.context = context  # what the submitter knew: aligned slot, datagram time
+        self.submitted = None
+        self.cancelled = False
+
+
+def _chain(first, second):
+    if first is None or second is None:
+        return first or second
+
+    def both(ok):
+        first(ok)
+        second(ok)
+    return both
+
+
+class ActionQueue:
+    def __init__(self, loop, perform, clock=time.perf_counter):
+        self.loop = loop
+        self.perform = perform  # perform(action) -> True, False, or None if not needed
+        self.clock = clock
+        self.pending = deque()
+        self.scheduled = False
+
+    def __len__(self):
+        return len(self.pending)
+
+    def submit(self, action):
+        for queued in self.pending:
+            if queued.cancelled or queued.client_id != action.client_id or queued.key != action.key:
+                continue
+            if action.tx is not None and queued.tx is not None:
+                # The state wanted now is all that matters
+                self._drop(queued, "superseded")
+            elif queued.tx is None and queued.fields is None and action.key in IDEMPOTENT:
+                ACTIONS_DROPPED.inc(reason="merged")
+                queued.on_done = _chain(queued.on_done, action.on_done)
+                return queued
+        action.submitted = self.clock()
+        self.pending.append(action)
+        if not self.scheduled:
+            # Drained on the next loop pass: requests made in the same pass coalesce
+            self.scheduled = True
+            self.loop.call_later(0, self.drain)
+        return action
+
+    def cancel(self, client_id):
+        """Drop an instance's pending actions; returns how many."""
+        count = 0
+        for queued in self.pending:
+            if not queued.cancelled and queued.client_id == client_id:
+                self._drop(queued, "cancelled")
+                count += 1
+        return count
+
+    def _drop(self, action, reason):
+        action.cancelled = True
+        ACTIONS_DROPPED.inc(reason=reason)
+
+    def drain(self):
+        self.scheduled = False
+        while self.pending:
+            action = self.pending.popleft()
+            if action.cancelled:
+                continue
+            start = self.clock()
+            ACTION_WAIT.observe(start - action.submitted, key=action.key)
+            try:
+                ok = self.perform(action)
+            finally:
+                ACTION_RUN.observe(self.clock() - start, key=action.key)
+            if action.on_done is not None:
+                action.on_done(ok)
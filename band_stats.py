@@ -0,0 +1,157 @@
+"""
+Per-slot band activity statistics
+
+Decodes are bucketed into T/R periods (15 s for FT8, 7.5 s for FT4, the
+client's own period for anything else) per band and mode.  Each band/mode
+keeps fixed-size `array` ring buffers covering the last STATS_HOURS hours:
+decode count, distinct callers, an SNR histogram and DT sums per slot.  A
+decode costs one slot lookup and a handful of increments; a slot is cleared
+when the ring comes round to it again, so memory stays the same however long
+the service runs.
+
+Distinct callers need the set of calls seen, which is kept only for the last
+few slots (decodes of a period all arrive before the next one ends); older
+slots keep just the count.
+"""
+
+import os
+import time
+from array import array
+from bisect import bisect_right
+
+from tr_period import DEFAULT_PERIOD, PERIODS, slot_of
+
+STATS_HOURS = float(os.environ.get("AUTOTX73_STATS_HOURS", "3"))
+# Decode.mode is the one-character mode marker shown in the band activity pane
+MODE_MARKERS = {"~": "FT8", "+": "FT4", "`": "FST4", ":": "Q65"}
+# SNR histogram bin edges (dB): <-20, -20..-16, ..., 0..4, >=5
+SNR_EDGES = (-20, -15, -10, -5, 0, 5)
+SNR_LABELS = ("<-20", "-20", "-15", "-10", "-5", "0", "+5")
+OPEN_SLOTS = 3  # slots whose caller sets are kept
+
+
+class SlotStats:
+    """Ring buffers for one band and mode."""
+
+    def __init__(self, period, hours=STATS_HOURS):
+        self.period = period
+        self.size = max(1, int(hours * 3600 / period))
+        n = self.size
+        self.slot = array("q", [-1]) * n  # slot number held at each index
+        self.decodes = array("I", [0]) * n
+        self.callers = array("I", [0]) * n
+        self.snr_sum = array("l", [0]) * n
+        self.snr_hist = array("I", [0]) * (n * len(SNR_LABELS))
+        self.dt_sum = array("d", [0.0]) * n
+        self.dt_sq = array("d", [0.0]) * n
+        self.latest = -1
+        self.open = {}  # slot -> calls seen, for the last OPEN_SLOTS slots
+
+    def _index(self, slot):
+        i = slot % self.size
+        if self.slot[i] != slot:
+            # The ring came round: this index still holds an old slot
+            self.slot[i] = slot
+            self.decodes[i] = self.callers[i] = self.snr_sum[i] = 0
+            self.dt_sum[i] = self.dt_sq[i] = 0.0
+            bins = len(SNR_LABELS)
+            self.snr_hist[i * bins:(i + 1) * bins] = array("I", [0]) * bins
+        return i
+
+    def add(self, slot, snr, dt, caller):
+        if slot <= self.latest - self.size:
+            return  # older than the ring
+        i = self._index(slot)
+        if slot > self.latest:
+            self.latest = slot
+            for old in [s for s in self.open if s <= slot - OPEN_SLOTS]:
+                del self.open[old]
+        self.decodes[i] += 1
+        self.snr_sum[i] += snr
+        self.snr_hist[i * len(SNR_LABELS) + bisect_right(SNR_EDGES, snr)] += 1
+        self.dt_sum[i] += dt
+        self.dt_sq[i] += dt * dt
+        if caller:
+            calls = self.open.get(slot)
+            if calls is None:
+                if slot <= self.latest - OPEN_SLOTS:
+                    return
+                calls = self.open[slot] = set()
+            if caller not in calls:
+                calls.add(caller)
+                self.callers[i] += 1
+
+    def summary(self, last, slots):
+        """Totals over the `slots` slots ending with slot `last`: slots
+        with decodes, decodes and callers per active slot, SNR histogram
+        and mean, DT mean and spread."""
+        bins = len(SNR_LABELS)
+        hist = [0] * bins
+        active = decodes = callers = peak = snr = 0
+        dt = dt_sq = 0.0
+        for slot in range(max(last - slots + 1, last - self.size + 1), last + 1):
+            i = slot % self.size
+            if self.slot[i] != slot or not self.decodes[i]:
+                continue
+            active += 1
+            decodes += self.decodes[i]
+            callers += self.callers[i]
+            peak = max(peak, self.callers[i])
+            snr += self.snr_sum[i]
+            dt += self.dt_sum[i]
+            dt_sq += self.dt_sq[i]
+            for b in range(bins):
+                hist[b] += self.snr_hist[i * bins + b]
+        if not decodes:
+            return {'slots': 0, 'decodes': 0}
+        dt_mean = dt / decodes
+        return {
+            'slots': active,
+            'decodes': decodes,
+            'decodes_per_slot': round(decodes / active, 1),
+            'callers_per_slot': round(callers / active, 1),
+            'peak_callers': peak,
+            'snr_mean': round(snr / decodes, 1),
+            'snr_histogram': dict(zip(SNR_LABELS, hist)),
+            'dt_mean': round(dt_mean, 2),
+            'dt_spread': round(max(0.0, dt_sq / decodes - dt_mean * dt_mean) ** 0.5, 2),
+        }
+
+
+class BandActivity:
+    """SlotStats per "band mode" key, fed with Decode records."""
+
+    def __init__(self, hours=STATS_HOURS, clock=time.time):
+        self.hours = hours
+        self.clock = clock
+        self.stats = {}
+
+    def add(self, decode, band, status_mode=None, tr_period=None, caller=None):
+        mode = status_mode or MODE_MARKERS.get(decode.mode, decode.mode)
+        key = f"{band} {mode}" if band else mode
+        stats = self.stats.get(key)
+        if stats is None:
+            period = PERIODS.get(mode) or tr_period or DEFAULT_PERIOD
+            stats = self.stats[key] = SlotStats(period, self.hours)
+        stats.add(slot_of(decode.time_ms, stats.period, self.clock()), decode.snr, decode.delta_time, caller)
+        return key
+
+    def summary(self):
+        """For each band/mode: the latest slot and the last hour."""
+        out = {}
+        for key, stats in self.stats.items():
+            out[key] = {
+                'period': stats.period,
+                'last_slot': stats.summary(stats.latest, 1),
+                'last_hour': stats.summary(stats.latest, int(3600 / stats.period)),
+            }
+        return out
+
+
+def format_summary(key, summary):
+    """One line for the console and the curses UI."""
+    slot, hour = summary['last_slot'], summary['last_hour']
+    if not hour['decodes']:
+        return f"{key}: no decodes"
+    return (f"{key}: {slot['decodes']} decodes, {slot.get('callers_per_slot', 0):.0f} calls last slot; "
+            f"hour {hour['decodes_per_slot']}/slot, SNR {hour['snr_mean']:+.0f} dB, DT {hour['dt_mean']:+.1f} s")
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for the AutoTX73 hot paths
+
+    python3 bench.py keystrokes [--xvfb] [-n 200]
+    python3 bench.py watchlist [-n 50]
+    python3 bench.py occupancy [-n 1000]
+    python3 bench.py callers [-n 1000]
+"""
+
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+
+
+def report(label, samples):
+    samples = sorted(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1] if len(samples) >= 20 else samples[-1]
+    print(f"{label:<28} n={len(samples):<5} median={statistics.median(samples) * 1e3:8.3f} ms"
+          f"  p95={p95 * 1e3:8.3f} ms  max={samples[-1] * 1e3:8.3f} ms")
+
+
+def timed(fn, n):
+    samples = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return samples
+
+
+def start_xvfb(display=":99"):
+    if not shutil.which("Xvfb"):
+        sys.exit("✘  Xvfb not installed")
+    proc = subprocess.Popen(["Xvfb", display, "-screen", "0", "1024x768x24"],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    os.environ["DISPLAY"] = display
+    time.sleep(1)
+    return proc
+
+
+def bench_keystrokes(args):
+    xvfb = start_xvfb() if args.xvfb else None
+    try:
+        import keystrokes
+        from windows import WindowRegistry, FakeBackend as FakeWindows
+        # A real window for JTDX to stand in for.  Xvfb has no window manager,
+        # so nothing would answer the activate request: the registry is told
+        # the id directly and the window is given the input focus up front
+        from Xlib import X, display as xdisplay
+        d = xdisplay.Display()
+        win = d.screen().root.create_window(0, 0, 100, 100, 0, d.screen().root_depth)
+        win.set_wm_name("JTDX bench")
+        win.map()
+        d.sync()
+        win.set_input_focus(X.RevertToParent, X.CurrentTime)
+        d.sync()
+        fake_windows = FakeWindows()
+        fake_windows.add(hex(win.id), "JTDX bench")
+        registry = WindowRegistry(fake_windows)
+
+        xtest = keystrokes.XTestBackend(registry)
+        if not xtest.send_alt("n"):
+            sys.exit("✘  The bench window did not get the focus: send_alt would time out")
+        report("xtest press_alt", timed(lambda: xtest.press_alt("n"), args.n))
+        report("xtest focus + press_alt", timed(lambda: xtest.send_alt("n"), args.n))
+        if shutil.which("xte"):
+            xte = keystrokes.SubprocessBackend(registry)
+            report("xte press_alt", timed(lambda: xte.press_alt("n"), args.n))
+        if shutil.which("wmctrl"):
+            wmctrl = lambda: subprocess.call(["wmctrl", "-ia", hex(win.id)],
+                                             stderr=subprocess.DEVNULL)
+            report("wmctrl -ia (focus only)", timed(wmctrl, args.n))
+    finally:
+        if xvfb:
+            xvfb.terminate()
+
+
+def bench_watchlist(args):
+    import random
+    import watchlist
+    rng = random.Random(73)
+    letters = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+    def call():
+        return "".join(rng.choices(letters, k=2)) + str(rng.randrange(10)) + "".join(rng.choices(letters, k=3))
+
+    # One band-full of traffic: CQs, replies, reports and 73s
+    decodes = []
+    for _ in range(1000):
+        a, b = call(), call()
+        decodes.append(rng.choice((f"CQ {a} KI03", f"{a} {b} JO62", f"{a} {b} -12",
+                                   f"{a} {b} R-08", f"{a} {b} RR73", f"CQ DX {a} FN31")))
+    print(f"per {len(decodes)} decodes:")
+    for size in (1, 10, 100, 1000, 10000):
+        watch = watchlist.Watchlist(own=("5Z4XB",), calls=[call() for _ in range(size)],
+                                    prefixes=[call()[:3] for _ in range(size)])
+        report(f"{size} calls + {size} prefixes", timed(lambda: [watch.scan(d) for d in decodes], args.n))
+
+
+def bench_occupancy(args):
+    import random
+    import occupancy
+    rng = random.Random(73)
+    occ = occupancy.Occupancy()
+    # A busy band: 25 signals a period for an hour of FT8
+    for period in range(240):
+        for _ in range(25):
+            occ.add(period * 15000, rng.randrange(200, 2950), periods=1)
+    print("numpy" if occupancy.np is not None else "pure Python (numpy not installed)")
+    report("add decode", timed(lambda: occ.add(240 * 15000, rng.randrange(200, 2950)), args.n))
+    report("roll period", timed(occ.roll, args.n))
+    report("clearest offset", timed(lambda: occ.clearest(50, 1500), args.n))
+
+
+def bench_callers(args):
+    import random
+    import callers
+    import wsjtx_protocol as proto
+    rng = random.Random(73)
+    print("per period, adding every caller then ranking:")
+    for size in (1, 3, 10, 30):
+        records = [proto.Decode("JTDX", True, 0, rng.randint(-24, 10), rng.uniform(-2, 2),
+                                rng.randrange(200, 2950), "~", f"5Z4XB DL{i}ABC JO62", False, False)
+                   for i in range(size)]
+
+        def pick():
+            pileup = callers.Pileup(0, 18, 0)
+            for i, record in enumerate(records):
+                pileup.add(f"DL{i}ABC", "JO62", record, worked=i % 4 == 0, wanted=i % 7 == 0)
+            return pileup.ranked()[0]
+        report(f"{size} callers", timed(pick, args.n))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    sub = parser.add_subparsers(dest="bench", required=True)
+    p = sub.add_parser("keystrokes", help="keystroke backend latency against an X server")
+    p.add_argument("--xvfb", action="store_true", help="start a private Xvfb on :99")
+    p.add_argument("-n", type=int, default=200)
+    p.set_defaults(func=bench_keystrokes)
+    p = sub.add_parser("watchlist", help="decode scan cost against watchlist size")
+    p.add_argument("-n", type=int, default=50)
+    p.set_defaults(func=bench_watchlist)
+    p = sub.add_parser("occupancy", help="clear-frequency finder update and search")
+    p.add_argument("-n", type=int, default=1000)
+    p.set_defaults(func=bench_occupancy)
+    p = sub.add_parser("callers", help="pileup caller scoring and ranking")
+    p.add_argument("-n", type=int, default=1000)
+    p.set_defaults(func=bench_callers)
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Choosing between stations that answer our CQ
+
+When several stations call us in the same period their decodes arrive in a
+burst, and taking the first one means the partner is picked by packet order.
+The engine instead collects every caller decoded in a period into a Pileup
+and, PICK_WINDOW after the first one (or at the reply deadline, whichever
+comes first), starts the QSO with the best-scoring caller:
+
+    score = SNR
+            - WORKED_PENALTY   if already in the log on this band and mode
+            + WANTED_BONUS     if on the watchlist
+            - DT_WEIGHT per second of |DT| beyond DT_OK
+
+The reply deadline is REPLY_BY of a period into the period after the
+callers' one: later than that our answer would start too late in the period
+to be decoded.  Scoring is a few additions per caller; worked-before and
+the watchlist are looked up once, as each caller is added.
+"""
+
+import os
+from collections import namedtuple
+
+PICK_WINDOW = float(os.environ.get("AUTOTX73_PICK_WINDOW", "0.3"))  # seconds after the first caller
+REPLY_BY = 0.2  # of a period into our reply period
+WORKED_PENALTY = 30  # dB
+WANTED_BONUS = 20  # dB
+DT_OK = 0.5  # seconds
+DT_WEIGHT = 10  # dB per second
+
+Caller = namedtuple("Caller", "call grid snr dt worked wanted score record")
+
+
+def score(snr, dt, worked=False, wanted=False):
+    s = snr
+    if worked:
+        s -= WORKED_PENALTY
+    if wanted:
+        s += WANTED_BONUS
+    off = abs(dt) - DT_OK
+    if off > 0:
+        s -= DT_WEIGHT * off
+    return s
+
+
+class Pileup:
+    """The callers decoded in one period."""
+
+    def __init__(self, slot, deadline, started):
+        self.slot = slot
+        self.deadline = deadline  # Unix time the reply must go out by
+        self.started = started  # perf_counter() of the first caller's datagram
+        self.callers = {}  # call -> Caller, the strongest decode of each
+        self.timer = None
+
+    def __len__(self):
+        return len(self.callers)
+
+    def add(self, call, grid, record, worked=False, wanted=False):
+        caller = Caller(call, grid, record.snr, record.delta_time, worked, wanted,
+                        score(record.snr, record.delta_time, worked, wanted), record)
+        previous = self.callers.get(call)
+        if previous is None or caller.score > previous.score:
+            if previous is not None and caller.grid is None:
+                caller = caller._replace(grid=previous.grid)
+            self.callers[call] = caller
+        return caller
+
+    def ranked(self):
+        """Callers best first; ties go to the earlier decode."""
+        return sorted(self.callers.values(), key=lambda c: -c.score)
+
+
+def describe(caller):
+    notes = [f"{caller.snr:+d} dB", f"DT {caller.dt:+.1f}"]
+    if caller.wanted:
+        notes.append("wanted")
+    if caller.worked:
+        notes.append("worked before")
+    return f"{caller.call} ({', '.join(notes)})"
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Optional raw datagram capture (replaces the per-packet tx_debug.log)
+
+When AUTOTX73_CAPTURE names a file, every received datagram is queued with its
+timestamp and a background thread appends them in batches to a binary
+capture file, rotating it at AUTOTX73_CAPTURE_MAX bytes and keeping
+AUTOTX73_CAPTURE_KEEP old files.  Capture is off by default.
+
+File layout: an 8-byte magic, then records of
+    float64 unix time | uint32 length | datagram bytes   (big-endian)
+
+    python3 capture.py FILE [--raw]     pretty-print a capture
+"""
+
+import argparse
+import os
+import struct
+import sys
+import threading
+import time
+from collections import deque
+
+import wsjtx_protocol as proto
+
+FILE_MAGIC = b"AT73CAP1"
+_RECORD = struct.Struct(">dI")
+
+CAPTURE_PATH = os.environ.get("AUTOTX73_CAPTURE")
+CAPTURE_MAX_BYTES = int(os.environ.get("AUTOTX73_CAPTURE_MAX", str(16 * 1024 * 1024)))
+CAPTURE_KEEP = int(os.environ.get("AUTOTX73_CAPTURE_KEEP", "4"))
+FLUSH_INTERVAL = 2.0  # seconds between batched writes
+QUEUE_LIMIT = 10000  # datagrams held in memory before new ones are dropped
+
+
+class CaptureWriter:
+    def __init__(self, path, max_bytes=CAPTURE_MAX_BYTES, keep=CAPTURE_KEEP):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.keep = keep
+        self.queue = deque()
+        self.dropped = 0
+        self.written = 0
+        self.wake = threading.Event()
+        self.closed = False
+        self.file = None
+        self._open()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def record(self, data, when=None):
+        """Queue one datagram; never blocks or touches the disk."""
+        if len(self.queue) >= QUEUE_LIMIT:
+            self.dropped += 1
+            return
+        self.queue.append((time.time() if when is None else when, bytes(data)))
+
+    def _open(self):
+        self.file = open(self.path, "ab", buffering=256 * 1024)
+        if self.file.tell() == 0:
+            self.file.write(FILE_MAGIC)
+
+    def _rotate(self):
+        self.file.close()
+        for i in range(self.keep - 1, 0, -1):
+            src = f"{self.path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i + 1}")
+        if self.keep > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.unlink(self.path)
+        self._open()
+
+    def _write_batch(self):
+        q = self.queue
+        f = self.file
+        while q:
+            when, data = q.popleft()
+            f.write(_RECORD.pack(when, len(data)))
+            f.write(data)
+            self.written += 1
+        f.flush()
+        if f.tell() >= self.max_bytes:
+            self._rotate()
+
+    def _run(self):
+        while not self.closed:
+            self.wake.wait(FLUSH_INTERVAL)
+            self.wake.clear()
+            try:
+                self._write_batch()
+            except OSError:
+                self.queue.clear()
+
+    def close(self):
+        self.closed = True
+        self.wake.set()
+        self.thread.join(FLUSH_INTERVAL + 1)
+        try:
+            self._write_batch()
+        except OSError:
+            pass
+        self.file.close()
+
+
+def open_from_env():
+    """A CaptureWriter if AUTOTX73_CAPTURE is set, else None."""
+    if not CAPTURE_PATH:
+        return None
+    try:
+        return CaptureWriter(CAPTURE_PATH)
+    except OSError as e:
+        print(f"✘  Capture disabled: {e}", file=sys.stderr)
+        return None
+
+
+def iter_capture(path):
+    """Yield (unix time, datagram) from a capture file."""
+    with open(path, "rb") as f:
+        if f.read(len(FILE_MAGIC)) != FILE_MAGIC:
+            raise ValueError(f"{path}: not an AutoTX73 capture")
+        while True:
+            head = f.read(_RECORD.size)
+            if len(head) < _RECORD.size:
+                return
+            when, n = _RECORD.unpack(head)
+            data = f.read(n)
+            if len(data) < n:
+                return
+            yield when, data
+
+
+def describe(data):
+    """One-line summary of a datagram."""
+    header = proto.peek_header(data)
+    if header is None:
+        return f"<{len(data)} bytes, not WSJT-X>"
+    name = proto.TYPE_NAMES.get(header.type, f"type {header.type}")
+    try:
+        msg = proto.parse(data)
+    except proto.ProtocolError as e:
+        return f"{name:<10} {header.client_id}: <{e}>"
+    if isinstance(msg, proto.Decode):
+        hh, rem = divmod((msg.time_ms or 0) // 1000, 3600)
+        mm, ss = divmod(rem, 60)
+        detail = (f"{hh:02d}{mm:02d}{ss:02d} {msg.snr:+3d} {msg.delta_time:4.1f} "
+                  f"{msg.delta_frequency:4d} {msg.mode} {msg.message}")
+    elif isinstance(msg, proto.Status):
+        detail = (f"{msg.mode} {msg.dial_frequency} tx_enabled={msg.tx_enabled} "
+                  f"transmitting={msg.transmitting} dx={msg.dx_call or '-'}"
+                  + (f" tx='{msg.tx_message}'" if msg.tx_message else ""))
+    elif msg is None:
+        detail = f"<{len(data) - header.offset} byte payload>"
+    else:
+        detail = " ".join(f"{k}={v}" for k, v in msg._asdict().items() if k != "client_id")
+    return f"{name:<10} {header.client_id}: {detail}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pretty-print an AutoTX73 capture")
+    parser.add_argument("file")
+    parser.add_argument("--raw", action="store_true", help="also hex-dump each datagram")
+    args = parser.parse_args()
+    try:
+        for when, data in iter_capture(args.file):
+            stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(when))
+            print(f"{stamp}.{int(when % 1 * 1000):03d}  {describe(data)}")
+            if args.raw:
+                print("    " + data.hex())
+    except BrokenPipeError:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+Unix-domain socket command channel for the running AutoTX73 process
+
+Each request is one line, either JSON ({"id": 1, "action": "enable"}) or a
+bare action word, and is answered with one JSON line once the command has
+been applied on the event loop:
+
+    {"id": 1, "action": "enable", "result": "ok", "seq": 7}
+
+Commands from every connection are applied in arrival order; `seq` numbers
+them across the process lifetime so callers can see the order they ran in.
+
+    python3 command_channel.py enable
+"""
+
+import errno
+import json
+import os
+import socket
+import sys
+
+SOCKET_PATH = os.environ.get("AUTOTX73_SOCKET", "/tmp/autotx73.sock")
+MAX_LINE = 4096
+
+
+class CommandError(Exception):
+    pass
+
+
+class CommandServer:
+    def __init__(self, loop, handler, path=SOCKET_PATH):
+        self.loop = loop
+        self.handler = handler  # handler(action) -> result string
+        self.path = path
+        self.seq = 0
+        self.buffers = {}
+        if _listening(path):
+            raise OSError(errno.EADDRINUSE, "another AutoTX73 process owns the command socket", path)
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(path)
+        # The CGI runs as the web server user
+        os.chmod(path, 0o666)
+        self.sock.listen(8)
+        self.sock.setblocking(False)
+        loop.add_reader(self.sock, self._accept)
+
+    def _accept(self, sock):
+        try:
+            conn, _ = sock.accept()
+        except BlockingIOError:
+            return
+        conn.setblocking(False)
+        self.buffers[conn] = b""
+        self.loop.add_reader(conn, self._read)
+
+    def _drop(self, conn):
+        self.loop.remove_reader(conn)
+        self.buffers.pop(conn, None)
+        conn.close()
+
+    def _read(self, conn):
+        try:
+            data = conn.recv(MAX_LINE)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+        if not data:
+            self._drop(conn)
+            return
+        buf = self.buffers[conn] + data
+        *lines, rest = buf.split(b"\n")
+        if len(rest) > MAX_LINE:
+            self._drop(conn)
+            return
+        self.buffers[conn] = rest
+        for line in lines:
+            if line.strip():
+                reply = self.execute(line)
+                try:
+                    conn.sendall(json.dumps(reply).encode() + b"\n")
+                except OSError:
+                    self._drop(conn)
+                    return
+
+    def execute(self, line):
+        try:
+            request = json.loads(line)
+        except ValueError:
+            request = {"action": line.decode(errors="replace").strip()}
+        if not isinstance(request, dict):
+            request = {"action": str(request)}
+        self.seq += 1
+        reply = {"id": request.get("id"), "action": request.get("action"), "seq": self.seq}
+        try:
+            reply["result"] = self.handler(request.get("action"))
+        except Exception as e:
+            reply["result"] = "error"
+            reply["error"] = str(e)
+        return reply
+
+    def close(self):
+        self.loop.remove_reader(self.sock)
+        for conn in list(self.buffers):
+            self._drop(conn)
+        self.sock.close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+
+def _listening(path):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        try:
+            s.connect(path)
+        except OSError:
+            return False
+    return True
+
+
+def send_command(action, path=SOCKET_PATH, timeout=5.0):
+    """Send one command and wait for its acknowledgement.
+
+    Raises OSError if no AutoTX73 process is listening and CommandError if the
+    command was rejected.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.settimeout(timeout)
+        s.connect(path)
+        s.sendall(json.dumps({"id": os.getpid(), "action": action}).encode() + b"\n")
+        buf = b""
+        while not buf.endswith(b"\n"):
+            chunk = s.recv(MAX_LINE)
+            if not chunk:
+                raise CommandError("connection closed before acknowledgement")
+            buf += chunk
+    reply = json.loads(buf)
+    if reply.get("result") in ("error", "unknown"):
+        raise CommandError(f"{action}: {reply.get('error') or reply.get('result')}")
+    return reply
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        sys.exit(f"usage: {sys.argv[0]} ACTION")
+    try:
+        print(json.dumps(send_command(sys.argv[1])))
+    except (OSError, CommandError) as e:
+        sys.exit(f"✘  {e}")
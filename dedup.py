@@ -0,0 +1,47 @@
+"""
+Bounded set of recently seen decodes
+
+JTDX / WSJT-X send their decode history again on a Replay request or a
+restart, and a relay loop can deliver the same datagram twice.  The engine
+checks each Decode against a RecentSet keyed by (client id, period time,
+audio offset, text) before the QSO logic sees it, so a repeated "DL1ABC
+5Z4XB RR73" cannot finish a QSO or fire Alt-N a second time.
+
+The set is an OrderedDict used as an LRU: one lookup, one move and at most
+one eviction per decode, capacity entries at most, and entries older than
+`window` seconds no longer count (period times repeat every day).
+"""
+
+from collections import OrderedDict
+
+CAPACITY = 4096  # a few busy hours of decodes
+WINDOW = 3600  # seconds
+
+
+class RecentSet:
+    def __init__(self, clock, capacity=CAPACITY, window=WINDOW):
+        self.clock = clock
+        self.capacity = capacity
+        self.window = window
+        self.entries = OrderedDict()  # key -> time last seen
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def seen(self, key):
+        """True if `key` was added within the window; adds it either way."""
+        now = self.clock()
+        entries = self.entries
+        last = entries.get(key)
+        entries[key] = now
+        if last is not None:
+            entries.move_to_end(key)
+            if now - last < self.window:
+                self.hits += 1
+                return True
+        elif len(entries) > self.capacity:
+            entries.popitem(last=False)
+        self.misses += 1
+        return False
@@ -0,0 +1,1096 @@
+"""
+AutoTX73 automation engine
+
+One Engine owns the WSJT-X socket, parses each datagram once, runs the QSO /
+CQ state machine for every client id and sends the Alt-key actions.  The
+front ends -- the headless console (autotx73.py), the curses UI
+(autotx73_ui.py) and the web status (status_http.StatusPublisher) -- subscribe
+to its event stream and read its state; none of them parse datagrams or press
+keys themselves, so one process can serve all of them at once.
+
+Events are Event(time, kind, client_id, fields), with kind one of
+
+    log        text                  a line for the operator
+    watch      record, hits          a Decode matched the watchlist
+    offset     offset, current       a clearer TX offset than the current one
+    logged     qso                   a QSO was added to the ADIF log
+    status     record                a Status datagram arrived
+    decode     record                a Decode datagram arrived
+    instance   opened                a client id appeared or sent Close
+    qso        partner, finished     a QSO started or finished
+    action     key, ok               an Alt-key was sent (or failed)
+    countdown  key, label, seconds, done
+    enabled    enabled               automation switched on or off
+"""
+
+import os
+import random
+import re
+import threading
+import time
+from collections import namedtuple
+
+import actions
+import band_stats
+import callers
+import capture
+import dedup
+import journal
+import keystrokes
+import metrics
+import occupancy
+import qso_log
+import tr_period
+import udp_listener
+import watchlist
+import wsjtx_protocol as proto
+
+# Your callsign
+CALLSIGN = "5Z4XB"
+# UDP listening port
+UDP_PORT = 2237
+
+# QSO and CQ detection works on the tokens of the watchlist scan (decoded
+# text, or our own TX message): a message with our call followed by another
+# call starts a QSO, one of these after our call finishes it
+FINISH_TOKENS = ("RR73", "R73", "73")
+# The locator that may follow the partner's call ("5Z4XB DL1ABC JO62")
+grid_pattern = re.compile(r"(?!RR73)[A-R]{2}[0-9]{2}")
+# Reply to a CQ from a watched station (UDP control backend only)
+WATCH_AUTO_REPLY = os.environ.get("AUTOTX73_WATCH_REPLY", "") not in ("", "0")
+# Before a CQ restart, point out a clearer TX offset when ours is busier by
+# this much (signals, decayed); the protocol can only move the Rx offset,
+# which is done through the UDP control backend if AUTOTX73_MOVE_OFFSET is set
+OFFSET_MARGIN = 1.0
+MOVE_OFFSET = os.environ.get("AUTOTX73_MOVE_OFFSET", "") not in ("", "0")
+
+DEBOUNCE_INTERVAL = 5  # seconds
+CQ_RESTART_IDLE = 300  # no QSO for this long -> Alt-6 and watch for our CQ
+CQ_RESTART_WINDOW = 60  # how long to watch for our CQ before sending Alt-N
+POST_QSO_TX_DELAY = 45  # normal wait before re-enabling TX after a QSO
+RANDOM_BREAK_AFTER = 3600  # after this much activity take a random break
+RANDOM_BREAK_RANGE = (180, 600)
+RANDOM_BREAK_TX_DELAY = 60  # wait between Alt-6 and Alt-N after a break
+ENABLE_TX_DELAY = 10  # between Alt-6 and Alt-N when the operator enables
+DISABLE_HALT_DELAY = 5  # between Alt-N and Alt-H when the operator disables
+
+# Only these message types reach the QSO logic; everything else is dropped
+# after reading the header
+WANTED_TYPES = (proto.STATUS, proto.DECODE, proto.CLOSE, proto.QSO_LOGGED)
+
+# Hot-path instrumentation, served as /metrics
+DATAGRAMS = metrics.registry.counter(
+    "autotx73_datagrams_total", "WSJT-X datagrams received, by message type", ("type",))
+PARSE_SECONDS = metrics.registry.histogram(
+    "autotx73_parse_seconds", "Time to parse a datagram the engine handles")
+ACTION_LATENCY = metrics.registry.histogram(
+    "autotx73_decode_to_action_seconds", "From a datagram's arrival to the action it triggered", ("key",))
+BACKEND_SECONDS = metrics.registry.histogram(
+    "autotx73_backend_call_seconds", "Keystroke / protocol command duration", ("backend",))
+SLOT_SLACK = metrics.registry.histogram(
+    "autotx73_slot_slack_seconds", "Time left before the T/R period when an aligned action went out",
+    buckets=metrics.SLACK_BUCKETS)
+REPEATS = metrics.registry.counter(
+    "autotx73_decode_repeats_total", "Decodes ignored as replayed or repeated, by reason", ("reason",))
+PICK_SECONDS = metrics.registry.histogram(
+    "autotx73_caller_pick_seconds", "Time to rank the stations calling us in a period")
+PILEUP = metrics.registry.histogram(
+    "autotx73_pileup_callers", "Stations calling us in one period", buckets=(1, 2, 3, 5, 10, 20))
+TIMER_SLIP = metrics.registry.histogram(
+    "autotx73_timer_slip_seconds", "How late loop timers ran")
+
+Event = namedtuple("Event", "time kind client_id fields")
+
+
+class Countdown:
+    def __init__(self, key, label, seconds, started, client_id=None):
+        self.key = key
+        self.label = label
+        self.seconds = seconds
+        self.started = started
+        self.client_id = client_id
+        self.timer = None
+
+    def value(self, now):
+        return min(self.seconds, int(now - self.started))
+
+
+# Post-QSO countdown labels as the journal names the pending step
+PENDING_STEPS = {"Post-QSO delay": "post-qso", "CQ restart delay": "break", "TX delay": "tx-delay"}
+
+# A delay that was stretched to end just before one of our TX periods: the
+# action fires `margin` seconds before period number `slot` starts
+Aligned = namedtuple("Aligned", "delay slot period")
+
+
+class QsoMachine:
+    """QSO/CQ state machine for one JTDX / WSJT-X instance.
+
+    Nothing here blocks: every delay is a timer on the loop, so the socket is
+    drained the whole time a countdown is running.
+    """
+
+    def __init__(self, engine, client_id):
+        self.engine = engine
+        self.loop = engine.loop
+        self.client_id = client_id
+        now = self.loop.time()
+        self.in_qso = False
+        self.other_callsign = None
+        self.other_grid = None
+        self.qso_start_wall = None  # unix time, for the log
+        self.last_qso_partner = None
+        self.status = None  # last Status, for band and mode
+        self.tx_enabled = False
+        self.calling_cq = False
+        self.last_complete_time = -DEBOUNCE_INTERVAL
+        self.last_qso_time = now
+        self.script_start_time = now
+        self.cq_restart_active = False
+        self.cq_restart_timer = None  # fires after CQ_RESTART_IDLE without a QSO
+        self.cq_window_timer = None  # fires when the CQ watch window runs out
+        self.post_qso_timer = None  # countdown to the next post-QSO step
+        self.occupancy = occupancy.Occupancy()
+        self.clear_offset = None  # quietest TX offset, refreshed every period
+        self.transmitting = False
+        self.tx_parity = None  # 0: we transmit in even periods, 1: odd
+        self.last_slack = None  # seconds to spare before the period of the last aligned action
+        self.resumed = False  # state came from the journal: check Status before toggling TX
+        self.pileup = None  # callers of the current period, until one is picked
+        self.schedule_cq_restart()
+
+    def say(self, text):
+        self.engine.say(text, self.client_id)
+
+    def send(self, key, label, tx=None, on_done=None):
+        return self.engine.send_key(key, label, self.client_id, tx, on_done)
+
+    @property
+    def countdown_key(self):
+        return ("post-qso", self.client_id)
+
+    def stop(self):
+        """Cancel every pending automatic action."""
+        for timer in (self.cq_restart_timer, self.cq_window_timer):
+            if timer is not None:
+                timer.cancel()
+        self.cq_restart_timer = self.cq_window_timer = None
+        self.cq_restart_active = False
+        if self.pileup is not None:
+            self.pileup.timer.cancel()
+            self.pileup = None
+        self.engine.actions.cancel(self.client_id)
+        if self.post_qso_timer is not None:
+            self.engine.cancel_countdown(self.post_qso_timer.key)
+            self.post_qso_timer = None
+
+    def journal(self):
+        self.engine.journal_state(self)
+
+    def state(self):
+        """What the journal keeps to resume after a restart (Unix times)."""
+        wall = self.engine.to_wall
+        pending = None
+        if self.post_qso_timer is not None:
+            pending = [PENDING_STEPS[self.post_qso_timer.label], wall(self.post_qso_timer.timer.when)]
+        return {
+            'in_qso': self.in_qso, 'partner': self.other_callsign, 'grid': self.other_grid,
+            'qso_start': self.qso_start_wall, 'last_partner': self.last_qso_partner,
+            'last_qso': wall(self.last_qso_time), 'script_start': wall(self.script_start_time),
+            'cq_restart': self.cq_restart_active,
+            'cq_window': wall(self.cq_window_timer.when) if self.cq_window_timer else None,
+            'pending': pending, 'parity': self.tx_parity,
+        }
+
+    def restore(self, state):
+        """Take over a journaled state and re-arm its timers."""
+        self.stop()
+        loop_time = self.engine.to_loop
+        self.in_qso = state['in_qso']
+        self.other_callsign = state['partner']
+        self.other_grid = state['grid']
+        self.qso_start_wall = state['qso_start']
+        self.last_qso_partner = state['last_partner']
+        self.last_qso_time = loop_time(state['last_qso'])
+        self.script_start_time = loop_time(state['script_start'])
+        self.tx_parity = state['parity']
+        self.resumed = True
+        if not self.engine.enabled:
+            return
+        now = self.loop.time()
+        if state['pending']:
+            step, due = state['pending']
+            labels = [label for label, name in PENDING_STEPS.items() if name == step]
+            on_done = {"post-qso": self.post_qso_enable_tx, "break": self.break_over,
+                       "tx-delay": lambda: self.post_qso_enable_tx(True)}.get(step)
+            if on_done is None or not labels:
+                # Not a step this version knows: carry on as if nothing was pending
+                self.schedule_cq_restart()
+                return
+            remaining = round(loop_time(due) - now)
+            if remaining <= 0:
+                # Came due while we were down: run it now, there is nothing to count down
+                self.loop.call_later(0, on_done)
+            else:
+                self.post_qso_timer = self.engine.start_countdown(
+                    self.countdown_key, remaining, labels[0], on_done, self.client_id)
+        elif state['cq_restart']:
+            self.cq_restart_active = True
+            due = loop_time(state['cq_window']) if state['cq_window'] else now
+            self.cq_window_timer = self.loop.call_at(due, self.cq_window_expired)
+        else:
+            self.schedule_cq_restart()
+
+    def may_toggle_tx(self):
+        """Alt-N toggles, so after a restart it is only sent once a Status
+        shows TX off: the toggle may have gone out just before the crash."""
+        if not self.resumed:
+            return True
+        self.resumed = False
+        if self.status is not None and not self.tx_enabled:
+            return True
+        reason = "TX is already enabled" if self.status is not None else "no Status from the client yet"
+        self.say(f"Not toggling TX after the restart: {reason}")
+        return False
+
+    # CQ restart
+
+    def schedule_cq_restart(self):
+        if self.cq_restart_timer is not None:
+            self.cq_restart_timer.cancel()
+            self.cq_restart_timer = None
+        if self.engine.enabled and self.post_qso_timer is None and not self.cq_restart_active:
+            self.cq_restart_timer = self.engine.call_aligned(
+                self.last_qso_time + CQ_RESTART_IDLE - self.loop.time(), self.cq_restart, self.client_id)
+
+    def reset_cq_restart(self):
+        self.cq_restart_active = False
+        if self.cq_window_timer is not None:
+            self.cq_window_timer.cancel()
+            self.cq_window_timer = None
+        self.schedule_cq_restart()
+
+    def cq_restart(self):
+        self.cq_restart_timer = None
+        self.say("CQ restart: No new QSO in 5 minutes, sending Alt-6 and waiting for CQ message...")
+        self.engine.suggest_tx_offset(self)
+        self.send("6", "Alt‑6 sent")
+        self.cq_restart_active = True
+        # Do NOT reset last_qso_time here
+        self.cq_window_timer = self.engine.call_aligned(CQ_RESTART_WINDOW, self.cq_window_expired, self.client_id)
+        self.journal()
+
+    def cq_window_expired(self):
+        self.cq_window_timer = None
+        self.say("CQ restart: No CQ detected in 1 minute, sending Alt-N to enable TX.")
+        if self.may_toggle_tx():
+            self.send("n", "Alt‑N sent – Tx toggled", tx=True)
+        self.say("No CQ detected, TX enabled. Timers reset.")
+        self.last_qso_time = self.loop.time()  # Reset timer ONLY when TX is enabled
+        self.reset_cq_restart()
+        self.journal()
+
+    # Post-QSO sequence
+
+    def qso_finished(self, now):
+        complete_time = time.strftime('%Y-%m-%d %H:%M:%S')
+        self.say(f"✅ --- QSO finished at {complete_time} ---")
+        self.last_qso_partner = self.other_callsign
+        self.engine.emit("qso", self.client_id, partner=self.other_callsign, finished=True)
+        self.engine.log_finished_qso(self)
+        # Do NOT reset last_qso_time here
+        # No CQ restart while the post-QSO sequence is pending
+        self.cq_restart_active = False
+        for timer in (self.cq_restart_timer, self.cq_window_timer):
+            if timer is not None:
+                timer.cancel()
+        self.cq_restart_timer = self.cq_window_timer = None
+        if not self.engine.enabled:
+            self.in_qso = False
+            return
+        # After 60 minutes of script activity, randomize CQ re-enable
+        if now - self.script_start_time > RANDOM_BREAK_AFTER:
+            delay = random.randint(*RANDOM_BREAK_RANGE)
+            self.say(f"Waiting {delay//60} min {delay%60} sec before re-enabling CQ (Alt-6)...")
+            self.post_qso_timer = self.engine.start_countdown(
+                self.countdown_key, delay, "CQ restart delay", self.break_over, self.client_id, align=True)
+        else:
+            self.say(f"Waiting {POST_QSO_TX_DELAY} seconds before enabling TX...")
+            self.post_qso_timer = self.engine.start_countdown(
+                self.countdown_key, POST_QSO_TX_DELAY, "Post-QSO delay", self.post_qso_enable_tx, self.client_id,
+                align=True)
+
+    def break_over(self):
+        self.send("6", "Alt‑6 sent")
+        self.say("--- CQ re-enabled (Alt-6 sent to JTDX) ---")
+        self.say(f"Waiting {RANDOM_BREAK_TX_DELAY} seconds before enabling TX...")
+        self.post_qso_timer = self.engine.start_countdown(
+            self.countdown_key, RANDOM_BREAK_TX_DELAY, "TX delay",
+            lambda: self.post_qso_enable_tx(True), self.client_id, align=True)
+        self.journal()
+
+    def post_qso_enable_tx(self, after_break=False):
+        self.post_qso_timer = None
+        if self.may_toggle_tx():
+            self.send("n", "Alt‑N sent – Tx toggled", tx=True,
+                      on_done=lambda ok: ok and self.say("--- TX enabled (Alt-N sent to JTDX) ---"))
+        now = self.loop.time()
+        if after_break:
+            self.script_start_time = now  # Reset 60-min timer after random shutdown
+        self.last_qso_time = now  # Reset timer ONLY when TX is enabled
+        self.in_qso = False
+        self.reset_cq_restart()
+        self.journal()
+
+    # Messages
+
+    def handle_message(self, msg, scan):
+        # The QSO logic only ever looks at message text: what we decoded, or
+        # what we are transmitting ourselves, tokenized once by the engine
+        if isinstance(msg, proto.Status):
+            self.status = msg
+            if msg.tx_enabled is not None:
+                self.tx_enabled = msg.tx_enabled
+            if msg.transmitting and not self.transmitting:
+                # We started transmitting: this period has our parity
+                period = tr_period.period_of(msg)
+                self.tx_parity = tr_period.slot_at(self.engine.wall(), period) % 2
+            self.transmitting = bool(msg.transmitting)
+            self.calling_cq = bool(self.tx_enabled and own_cq(scan))
+            self.follow_dx_call(msg.dx_call)
+        if scan.tokens:
+            self.handle_scan(scan, self.loop.time(), msg)
+        self.journal()
+
+    def follow_dx_call(self, dx_call):
+        # The client's DX call is who we are really working, whoever we picked
+        if not (self.in_qso and dx_call and watchlist.is_call(dx_call)):
+            return
+        if dx_call != self.other_callsign:
+            self.say(f"QSO partner changed: Now in QSO with {dx_call} (was {self.other_callsign})")
+            self.other_callsign = dx_call
+            self.other_grid = None
+            self.engine.emit("qso", self.client_id, partner=dx_call, finished=False)
+
+    def start_qso(self, partner, grid, now):
+        self.other_callsign = partner
+        self.other_grid = grid
+        self.qso_start_wall = self.engine.wall()
+        start_time = time.strftime('%Y-%m-%d %H:%M:%S')
+        self.say(f"🟢 --- New QSO started with {self.other_callsign} at {start_time} ---")
+        worked = self.engine.worked_before(self.other_callsign, self.client_id)
+        if worked:
+            self.say(f"(worked before on {worked})")
+        self.in_qso = True
+        self.last_qso_time = now  # Reset timer ONLY on QSO start
+        self.engine.emit("qso", self.client_id, partner=self.other_callsign, finished=False)
+        self.schedule_cq_restart()
+
+    def handle_scan(self, scan, now, msg=None):
+        tokens = scan.tokens
+        # Detect CQ call from our callsign
+        if own_cq(scan):
+            if self.in_qso:
+                self.say(f"QSO aborted: CQ detected from {CALLSIGN} during QSO with {self.other_callsign or 'UNKNOWN'}")
+                self.in_qso = False
+            if self.cq_restart_active:
+                self.say("TX already enabled (CQ detected). Timers reset.")
+                self.last_qso_time = now  # Reset timer ONLY if TX is enabled (CQ detected means TX is on)
+                self.reset_cq_restart()
+
+        # Detect start of QSO (your callsign followed by another callsign)
+        partner = grid = None
+        if scan.own >= 0 and scan.own + 1 < len(tokens) and watchlist.is_call(tokens[scan.own + 1]):
+            partner = tokens[scan.own + 1]
+            if scan.own + 2 < len(tokens) and grid_pattern.fullmatch(tokens[scan.own + 2]):
+                grid = tokens[scan.own + 2]
+        if partner and not self.in_qso and isinstance(msg, proto.Decode):
+            # Everyone calling in this period is ranked before one is picked
+            self.engine.add_caller(self, msg, partner, grid, scan)
+        # Others still calling once the QSO has started are not our partner
+        elif partner and partner != self.other_callsign:
+            return
+
+        # Detect completion (your callsign and RR73 or 73)
+        if (self.in_qso and self.post_qso_timer is None and scan.own >= 0
+                and any(t in FINISH_TOKENS for t in tokens[scan.own + 1:])):
+            if now - self.last_complete_time > DEBOUNCE_INTERVAL:
+                self.last_complete_time = now
+                self.qso_finished(now)
+
+
+def own_cq(scan):
+    # "CQ 5Z4XB KI03", "CQ DX 5Z4XB KI03"
+    return 0 < scan.own <= 2 and scan.tokens[0] == "CQ"
+
+
+class Engine:
+    """Datagram intake, one QsoMachine per client id, and the actions.
+
+    The first client seen takes over the machine that has been running since
+    start-up, so a single instance behaves exactly as before; each further
+    client id gets its own machine, and its actions go to that instance.
+    Automation only runs while `enabled`; the headless script starts enabled,
+    the UI waits for the operator.
+    """
+
+    def __init__(self, loop, enabled=True, wall=time.time, align_slots=tr_period.SLOT_ALIGN):
+        self.loop = loop
+        self.enabled = enabled
+        self.disabling = False  # the disable sequence must run to its Alt-H
+        self.listeners = []
+        self.machines = {}  # client id -> QsoMachine
+        self.actions = actions.ActionQueue(loop, self.perform)  # every keystroke, one at a time
+        # Clock for T/R periods (UTC); replays pass their virtual one
+        self.wall = wall
+        self.align_slots = align_slots
+        self.slot_margin = tr_period.SLOT_MARGIN
+        self.slot_target = None  # Aligned of the action running now
+        self.datagram_time = None  # perf_counter() when the datagram being handled arrived
+        self.intake = None
+        self.recent = dedup.RecentSet(loop.time)  # decodes already handled
+        loop.on_slip = TIMER_SLIP.observe
+        self.register_gauges()
+        self.startup = None  # machine_for() runs while it is being built
+        self.startup = QsoMachine(self, None)
+        self.started = loop.time()
+        self.countdowns = {}  # key -> Countdown, in start order
+        self.sock = None
+        self.relay = None
+        self.recorder = None
+        self.log = None
+        self.log_timer = None
+        self.journal = None
+        self.journal_timer = None
+        self.watchlist = watchlist.Watchlist(own=(CALLSIGN,))
+        self.activity = band_stats.BandActivity(clock=wall)
+
+    # Event stream
+
+    def subscribe(self, callback):
+        """Call callback(event) for every event from now on."""
+        self.listeners.append(callback)
+        return callback
+
+    def unsubscribe(self, callback):
+        self.listeners.remove(callback)
+
+    def emit(self, kind, client_id=None, **fields):
+        event = Event(self.loop.time(), kind, client_id, fields)
+        for callback in list(self.listeners):
+            callback(event)
+
+    def say(self, text, client_id=None):
+        # Tag the line with the instance once more than one is being automated
+        if client_id is not None and len(self.machines) > 1:
+            text = f"[{client_id}] {text}"
+        self.emit("log", client_id, text=text)
+
+    # Intake
+
+    def open(self, port=UDP_PORT):
+        """Bind the WSJT-X socket (plus capture and relay when configured)."""
+        self.recorder = capture.open_from_env()
+        if self.recorder:
+            self.say(f"✔ Capturing datagrams to {self.recorder.path}")
+        self.relay = udp_listener.relay_from_env()
+        if self.relay:
+            self.say("✔ Relaying datagrams to " + ", ".join(f"{h}:{p}" for h, p in self.relay.destinations))
+        self.log = qso_log.open_from_env()
+        if self.log:
+            self.say(f"✔ QSO log {self.log.path}: {len(self.log.calls)} calls worked")
+            self.log_timer = self.loop.call_every(qso_log.FLUSH_INTERVAL, self.flush_log)
+        self.watchlist = watchlist.load(own=(CALLSIGN,))
+        if len(self.watchlist) > 1:
+            self.say(f"✔ Watching {len(self.watchlist) - 1} calls, prefixes and entities")
+        for name in self.watchlist.unresolved:
+            self.say(f"✘  DXCC entity not found (is AUTOTX73_CTY set?): {name}")
+        self.open_journal(journal.open_from_env())
+        self.sock = udp_listener.open_listener(port)
+        self.intake = udp_listener.Intake(self.sock, self.loop, self.handle_datagram, self.relay, self.recorder,
+                                          udp_listener.count_overflows(self.sock)).start()
+        self.say(f"✔ Listening on {udp_listener.describe_listener(port)}, "
+                 f"{self.intake.rcvbuf // 1024} KB receive buffer")
+        return self.sock
+
+    def close(self):
+        if self.sock is not None:
+            self.intake.stop()
+            self.sock.close()
+            self.sock = None
+        if self.recorder:
+            self.recorder.close()
+        if self.relay:
+            self.relay.close()
+        if self.log:
+            self.log_timer.cancel()
+            self.log.close()
+            self.log = None
+        if self.journal:
+            self.journal_timer.cancel()
+            self.close_journal()
+
+    def machine(self, client_id):
+        m = self.machines.get(client_id)
+        if m is None:
+            if self.startup is not None:
+                m, self.startup = self.startup, None
+                m.client_id = client_id
+            else:
+                m = QsoMachine(self, client_id)
+            self.machines[client_id] = m
+            if len(self.machines) > 1:
+                self.say(f"✔ New instance: {client_id}")
+            self.emit("instance", client_id, opened=True)
+        return m
+
+    def all_machines(self):
+        return [self.startup] if self.startup is not None else list(self.machines.values())
+
+    def register_gauges(self):
+        # Read only when metrics are collected
+        gauge = metrics.registry.gauge
+        gauge("autotx73_threads", "Python threads alive", threading.active_count)
+        gauge("autotx73_loop_timers", "Timers queued on the event loop", self.loop.timer_count)
+        gauge("autotx73_loop_readers", "File objects watched by the event loop", self.loop.reader_count)
+        gauge("autotx73_instances", "JTDX / WSJT-X instances seen", lambda: len(self.machines))
+        gauge("autotx73_actions_pending", "Actions queued to be sent", lambda: len(self.actions))
+        gauge("autotx73_recent_decodes", "Decodes held for repeat detection", lambda: len(self.recent))
+        gauge("autotx73_rxq_dropped_total", "Datagrams the kernel dropped on a full receive queue (SO_RXQ_OVFL)",
+              lambda: self.intake.dropped if self.intake else 0, kind="counter")
+        gauge("autotx73_intake_overflow_total", "Times the intake queue was full (datagrams waited in the kernel)",
+              lambda: self.intake.overflows if self.intake else 0, kind="counter")
+        gauge("autotx73_intake_oversize_total", "Datagrams dropped for not fitting an intake slot",
+              lambda: self.intake.oversize if self.intake else 0, kind="counter")
+        gauge("autotx73_intake_batches_total", "Loop wakeups that processed queued datagrams",
+              lambda: self.intake.batches if self.intake else 0, kind="counter")
+        gauge("autotx73_intake_queue_depth", "Datagrams waiting for the loop",
+              lambda: self.intake.depth if self.intake else 0)
+        gauge("autotx73_intake_queue_peak", "Most datagrams waiting for the loop at once",
+              lambda: self.intake.peak if self.intake else 0)
+        gauge("autotx73_relayed_total", "Datagrams relayed",
+              lambda: self.relay.forwarded if self.relay else 0, kind="counter")
+
+    def handle_datagram(self, data, addr=None, sock=None):
+        self.datagram_time = time.perf_counter()
+        try:
+            self.dispatch(data, addr, sock)
+        finally:
+            self.datagram_time = None
+
+    def dispatch(self, data, addr, sock):
+        mtype = proto.message_type(data)
+        if mtype is None:
+            DATAGRAMS.inc(type="foreign")
+            return
+        DATAGRAMS.inc(type=proto.TYPE_NAMES.get(mtype, mtype))
+        if mtype not in WANTED_TYPES:
+            return
+        try:
+            msg = proto.parse(data)
+        except proto.ProtocolError:
+            return
+        PARSE_SECONDS.observe(time.perf_counter() - self.datagram_time)
+        if msg is None:
+            return
+        # The UDP control backend answers clients at the address they send from
+        keystrokes.backend().observe(msg, addr, sock)
+        if isinstance(msg, proto.QsoLogged):
+            self.log_logged_qso(msg)
+            return
+        if isinstance(msg, proto.Close):
+            m = self.machines.pop(msg.client_id, None)
+            if m is not None:
+                m.stop()
+                self.say(f"✔ Instance closed: {msg.client_id}")
+                self.emit("instance", msg.client_id, opened=False)
+                if self.journal:
+                    self.journal.record(msg.client_id, None)
+            return
+        decode = isinstance(msg, proto.Decode)
+        if decode and self.repeated(msg):
+            return
+        # Each message is tokenized and matched against every list once
+        scan = self.watchlist.scan((msg.message if decode else msg.tx_message) or "")
+        m = self.machine(msg.client_id)
+        m.handle_message(msg, scan)
+        if decode:
+            self.add_activity(m, msg, scan)
+            self.add_occupancy(m, msg)
+            if scan.own == 0:
+                # Someone calling us transmits in the periods we don't
+                period = tr_period.period_of(m.status)
+                m.tx_parity = 1 - tr_period.slot_of(msg.time_ms, period, self.wall()) % 2
+        self.emit("decode" if decode else "status", msg.client_id, record=msg)
+        if decode and len(scan.hits) > (scan.own >= 0):
+            self.watch_hit(m, msg, scan)
+
+    def repeated(self, msg):
+        """True for a Decode already handled (a Replay, a client restart, a
+        relay loop) or one the client flags as not new."""
+        if self.recent.seen((msg.client_id, msg.time_ms, msg.delta_frequency, msg.message)):
+            REPEATS.inc(reason="repeat")
+            return True
+        if msg.new is False:
+            REPEATS.inc(reason="old")
+            return True
+        return False
+
+    # Band activity
+
+    def add_activity(self, m, msg, scan):
+        status = m.status
+        if status is None:
+            self.activity.add(msg, None, caller=watchlist.sender(scan.tokens))
+        else:
+            self.activity.add(msg, qso_log.band_for(status.dial_frequency), status.mode,
+                              status.tr_period, caller=watchlist.sender(scan.tokens))
+
+    def activity_lines(self):
+        """One line per band/mode, busiest first."""
+        summaries = sorted(self.activity.summary().items(), key=lambda kv: -kv[1]['last_hour']['decodes'])
+        return [band_stats.format_summary(key, summary) for key, summary in summaries]
+
+    # TX offset
+
+    def signal_width(self, m):
+        mode = m.status.mode if m.status else None
+        return occupancy.SIGNAL_HZ.get(mode, occupancy.DEFAULT_SIGNAL_HZ)
+
+    def add_occupancy(self, m, msg):
+        occ = m.occupancy
+        new_period = msg.time_ms != occ.period_ms
+        periods = 1
+        if new_period and occ.period_ms is not None:
+            status = m.status
+            period = tr_period.period_of(status)
+            periods = int((msg.time_ms - occ.period_ms) // (period * 1000)) or 1
+            # The periods before this one are complete: refresh the suggestion
+            m.clear_offset = occ.clearest(self.signal_width(m), status.tx_df if status else None)[0]
+        occ.add(msg.time_ms, msg.delta_frequency, self.signal_width(m), periods)
+
+    def suggest_tx_offset(self, m):
+        tx_df = m.status.tx_df if m.status else None
+        offset, busy, here = m.occupancy.clearest(self.signal_width(m), tx_df)
+        m.clear_offset = offset
+        if offset == tx_df or (here is not None and here - busy < OFFSET_MARGIN):
+            return
+        where = f"{tx_df} Hz has {here:.1f}" if here is not None else "no TX offset known"
+        self.say(f"📡 Clearest TX offset: {offset} Hz ({busy:.1f} recent signals; {where})", m.client_id)
+        self.emit("offset", m.client_id, offset=offset, current=tx_df)
+        if MOVE_OFFSET and hasattr(keystrokes.backend(), "configure"):
+            self.send_key("configure", f"Rx offset moved to {offset} Hz", m.client_id,
+                          fields={'client_id': m.client_id, 'rx_df': offset})
+
+    # Pileups
+
+    def add_caller(self, m, msg, call, grid, scan):
+        now = self.wall()
+        period = tr_period.period_of(m.status)
+        slot = tr_period.slot_of(msg.time_ms, period, now)
+        pileup = m.pileup
+        if pileup is not None and slot > pileup.slot:
+            # A later period's callers: the earlier ones have waited long enough
+            pileup.timer.cancel()
+            self.pick_caller(m)
+            pileup = None
+        if m.in_qso:
+            return
+        if pileup is None:
+            deadline = (slot + 1 + callers.REPLY_BY) * period
+            pileup = m.pileup = callers.Pileup(slot, deadline, self.datagram_time or time.perf_counter())
+            delay = max(0, min(callers.PICK_WINDOW, deadline - now))
+            pileup.timer = self.loop.call_later(delay, self.pick_caller, m)
+        wanted = any(h.call == call and h.kind != "own" for h in scan.hits)
+        pileup.add(call, grid, msg, bool(self.worked_before(call, m.client_id)), wanted)
+
+    def pick_caller(self, m):
+        pileup, m.pileup = m.pileup, None
+        if pileup is None or m.in_qso:
+            return
+        with metrics.timed(PICK_SECONDS):
+            ranked = pileup.ranked()
+        best = ranked[0]
+        PILEUP.observe(len(ranked))
+        if len(ranked) > 1:
+            others = ", ".join(callers.describe(c) for c in ranked[1:])
+            self.say(f"🎯 Picked {callers.describe(best)} over {others}", m.client_id)
+        m.start_qso(best.call, best.grid, self.loop.time())
+        ACTION_LATENCY.observe(time.perf_counter() - pileup.started, key="pick")
+        if len(ranked) > 1:
+            self.call_picked(m, best, pileup.deadline)
+        m.journal()
+
+    def call_picked(self, m, caller, deadline):
+        # Ask the client to answer the caller we picked rather than the first
+        # one it decoded (UDP control backend only).  A Reply would not do:
+        # clients only act on one for a CQ or QRZ.  Whether it takes the
+        # request up shows in its Status DX call, which the machine follows.
+        if not self.enabled or not hasattr(keystrokes.backend(), "configure"):
+            return
+        self.send_key("configure", f"Asked the client to answer {caller.call}", m.client_id,
+                      fields={'client_id': m.client_id, 'dx_call': caller.call, 'dx_grid': caller.grid,
+                              'generate_messages': True},
+                      deadline=deadline)
+
+    # Watchlist
+
+    def watch_hit(self, m, msg, scan):
+        hits = [h for h in scan.hits if h.kind != "own"]
+        if not hits:
+            return
+        names = ", ".join(h.call if h.label == h.call else f"{h.call} ({h.label})" for h in hits)
+        self.say(f"👀 Watched {names}: {msg.message} ({msg.snr:+d} dB, {msg.delta_frequency} Hz)", m.client_id)
+        self.emit("watch", m.client_id, record=msg, hits=hits)
+        if not (WATCH_AUTO_REPLY and self.enabled and scan.tokens[0] == "CQ"):
+            return
+        if m.in_qso or m.post_qso_timer is not None:
+            return
+        # Only the station calling CQ, and not one already in the log
+        caller = watchlist.sender(scan.tokens)
+        if caller not in [h.call for h in hits] or self.worked_before(caller, m.client_id):
+            return
+        if hasattr(keystrokes.backend(), "reply"):
+            self.send_key("reply", f"Replying to {caller}", m.client_id, fields={'decode': msg})
+
+    # QSO log
+
+    def worked_before(self, call, client_id=None):
+        """"20m FT8" if `call` is in the log on the instance's current band
+        and mode, else None."""
+        m = self.machines.get(client_id)
+        if self.log is None or m is None or m.status is None:
+            return None
+        band = qso_log.band_for(m.status.dial_frequency)
+        mode = m.status.mode
+        if band and self.log.worked_before(call, band, mode):
+            return f"{band} {mode}"
+        return None
+
+    def log_finished_qso(self, m):
+        if self.log is None or not m.other_callsign:
+            return
+        status = m.status
+        qso = {
+            'call': m.other_callsign, 'grid': m.other_grid,
+            'frequency': status.dial_frequency + (status.tx_df or 0) if status else None,
+            'mode': status.mode if status else None,
+            'time_on': m.qso_start_wall, 'time_off': self.wall(),
+            'my_call': status.de_call if status else None,
+            'my_grid': status.de_grid if status else None,
+        }
+        if self.log.add_finished(qso):
+            self.emit("logged", m.client_id, qso=qso)
+
+    def log_logged_qso(self, msg):
+        if self.log is None or not msg.dx_call:
+            return
+        qso = {
+            'call': msg.dx_call, 'grid': msg.dx_grid, 'frequency': msg.tx_frequency,
+            'mode': msg.mode, 'time_on': msg.time_on, 'time_off': msg.time_off,
+            'report_sent': msg.report_sent, 'report_received': msg.report_received,
+            'tx_power': msg.tx_power, 'comments': msg.comments, 'name': msg.name,
+            'operator_call': msg.operator_call, 'my_call': msg.my_call, 'my_grid': msg.my_grid,
+        }
+        self.log.add_logged(qso)
+        self.say(f"📒 Logged {msg.dx_call} on {qso['band'] or '?'} {msg.mode}", msg.client_id)
+        self.emit("logged", msg.client_id, qso=qso)
+
+    def flush_log(self):
+        try:
+            self.log.flush()
+        except OSError as e:
+            self.say(f"✘  QSO log write failed: {e}")
+
+    # State journal
+
+    # Loop times are monotonic, journaled ones are wall clock; the offset is
+    # taken afresh each time so a clock step does not shift what is written
+    def to_wall(self, t):
+        return round(t + self.wall() - self.loop.time(), 1)
+
+    def to_loop(self, wall):
+        return wall - self.wall() + self.loop.time()
+
+    def journal_state(self, m):
+        # The startup machine has no client yet, so nothing worth resuming
+        if self.journal is not None and m.client_id is not None:
+            self.journal.record(m.client_id, m.state())
+
+    def open_journal(self, j):
+        """Resume from the journal `j` (None: journaling off) and keep it."""
+        self.journal = j
+        if j is not None:
+            self.resume(j)
+            self.journal_timer = self.loop.call_every(journal.FLUSH_INTERVAL, self.flush_journal)
+
+    def resume(self, j):
+        start = time.perf_counter()
+        try:
+            states = j.load()
+        except (OSError, ValueError) as e:
+            self.say(f"✘  State journal unreadable: {e}")
+            return
+        for client_id, state in states.items():
+            m = self.machine(client_id)
+            try:
+                m.restore(state)
+            except Exception as e:
+                # A state we cannot take over must not keep us from starting
+                m.stop()
+                self.machines.pop(client_id, None)
+                self.say(f"✘  Journaled state not resumed: {e!r}", client_id)
+                continue
+            what = f"in QSO with {m.other_callsign}" if m.in_qso else "idle"
+            if m.post_qso_timer is not None:
+                what += f", {m.post_qso_timer.label.lower()} {m.post_qso_timer.seconds}s left"
+            self.say(f"↻ Resumed {what}", client_id)
+        if states:
+            self.say(f"✔ State journal replayed in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    def flush_journal(self):
+        try:
+            self.journal.flush()
+        except OSError as e:
+            self.say(f"✘  State journal write failed: {e}")
+
+    def close_journal(self):
+        try:
+            self.journal.close()
+        except OSError:
+            pass
+        self.journal = None
+
+    # Actions
+
+    def send_key(self, key, label, client_id=None, tx=None, on_done=None, fields=None, deadline=None):
+        """Queue Alt-`key`; with `tx` set, an Alt-N that is only sent if the
+        instance's TX is not in that state when it runs.  With `fields`,
+        `key` is a UDP control request instead ("reply", "configure"),
+        called on the backend with those fields.  on_done(ok) gets True,
+        False, or None if nothing needed sending."""
+        return self.actions.submit(actions.Action(
+            key, label, client_id, tx, on_done, (self.slot_target, self.datagram_time, deadline), fields))
+
+    def perform(self, action):
+        key, label, client_id = action.key, action.label, action.client_id
+        target, datagram_time, deadline = action.context
+        m = self.machine_for(client_id)
+        if action.tx is not None and m is not None and m.status is not None and m.tx_enabled == action.tx:
+            # Alt-N toggles: sending it now would undo what we want
+            self.say(f"TX already {'on' if action.tx else 'off'}, Alt-N not needed", client_id)
+            return None
+        slack = None
+        try:
+            backend = keystrokes.backend()
+            with metrics.timed(BACKEND_SECONDS, backend=backend.name):
+                if action.fields is None:
+                    ok = backend.send_alt(key, client_id)
+                else:
+                    ok = getattr(backend, key)(**action.fields)
+            if datagram_time is not None:
+                ACTION_LATENCY.observe(time.perf_counter() - datagram_time, key=key)
+            if ok and action.tx is not None and m is not None:
+                m.tx_enabled = action.tx  # until the next Status says otherwise
+            if ok and target is not None:
+                # Measured after the keystroke went out, so backend latency counts
+                slack = target.slot * target.period - self.wall()
+                SLOT_SLACK.observe(slack)
+                start = time.strftime('%H:%M:%S', time.gmtime(target.slot * target.period))
+                label += f" ({slack:.2f} s before the {start} {'odd' if target.slot % 2 else 'even'} period)"
+                if m is not None:
+                    m.last_slack = slack
+            if ok and deadline is not None:
+                slack = deadline - self.wall()
+                label += f" ({slack:.2f} s before the reply deadline)"
+            if ok:
+                self.say(f"✅  {label}", client_id)
+            elif action.fields is None:
+                self.say("✘  No JTDX / WSJT‑X window found", client_id)
+            else:
+                self.say(f"✘  Not sent: {label}", client_id)
+        except Exception as e:
+            ok = False
+            self.say(f"✘  Command failed: {e}", client_id)
+        self.emit("action", client_id, key=key, ok=ok, slack=slack)
+        return ok
+
+    # T/R period alignment
+
+    def machine_for(self, client_id):
+        m = self.machines.get(client_id)
+        if m is None and client_id is None:
+            machines = self.all_machines()
+            m = machines[0] if len(machines) == 1 else None
+        return m
+
+    def align(self, delay, client_id=None):
+        """Stretch `delay` to end slot_margin seconds before the instance's
+        next TX period (of either parity while ours is not known yet)."""
+        m = self.machine_for(client_id)
+        period = tr_period.period_of(m.status if m else None)
+        now = self.wall()
+        slot = tr_period.next_slot(now + max(0, delay), period, m.tx_parity if m else None, self.slot_margin)
+        return Aligned(slot * period - self.slot_margin - now, slot, period)
+
+    def call_aligned(self, delay, callback, client_id=None):
+        """loop.call_later(), but firing just before one of our TX periods."""
+        if not self.align_slots:
+            return self.loop.call_later(delay, callback)
+        aligned = self.align(delay, client_id)
+        return self.loop.call_later(aligned.delay, self.run_aligned, aligned, callback)
+
+    def run_aligned(self, aligned, callback):
+        # send_key() reports the slack against this period
+        self.slot_target = aligned
+        try:
+            callback()
+        finally:
+            self.slot_target = None
+
+    def start_countdown(self, key, seconds, label, on_done, client_id=None, align=False):
+        """Run on_done after `seconds` (stretched to our next TX period with
+        `align`), replacing any countdown with this key."""
+        self.cancel_countdown(key)
+        aligned = None
+        if align and self.align_slots:
+            aligned = self.align(seconds, client_id)
+            seconds = max(0, round(aligned.delay))
+        countdown = Countdown(key, label, seconds, self.loop.time(), client_id)
+
+        def done():
+            self.countdowns.pop(key, None)
+            self.emit("countdown", client_id, key=key, label=label, seconds=seconds, done=True)
+            if aligned is None:
+                on_done()
+            else:
+                self.run_aligned(aligned, on_done)
+        countdown.timer = self.loop.call_later(aligned.delay if aligned else seconds, done)
+        self.countdowns[key] = countdown
+        self.emit("countdown", client_id, key=key, label=label, seconds=seconds, done=False)
+        return countdown
+
+    def cancel_countdown(self, key):
+        countdown = self.countdowns.pop(key, None)
+        if countdown is not None:
+            countdown.timer.cancel()
+            self.emit("countdown", countdown.client_id, key=key, label=countdown.label,
+                      seconds=countdown.seconds, done=True)
+
+    def enable(self):
+        """Alt-6, then Alt-N after ENABLE_TX_DELAY, and start the automation."""
+        if self.enabled or self.disabling:
+            return False
+        self.enabled = True
+        self.emit("enabled", enabled=True)
+        now = self.loop.time()
+        for m in self.all_machines():
+            m.last_qso_time = m.script_start_time = now
+            m.reset_cq_restart()
+            m.journal()
+        self.say("Enabling system: Sending Alt-6 (CQ)...")
+
+        def enable_tx():
+            self.say("Enabling TX (Alt-N)...")
+            # Each instance separately: Alt-N only where its TX is off
+            for m in self.all_machines():
+                self.send_key("n", "Alt-N sent - Tx toggled", m.client_id, tx=True,
+                              on_done=lambda ok, cid=m.client_id: ok and self.say(
+                                  "TX enabled (Alt-N sent). System is now active.", cid))
+
+        def cq_sent(ok):
+            # One countdown, started by the first instance that took its Alt-6
+            if ok and self.enabled and "system" not in self.countdowns:
+                self.start_countdown("system", ENABLE_TX_DELAY, "Enabling", enable_tx, align=True)
+        for m in self.all_machines():
+            self.send_key("6", "Alt-6 sent (CQ enabled)", m.client_id, on_done=cq_sent)
+        return True
+
+    def disable(self):
+        """Stop the automation, Alt-N, then Alt-H after DISABLE_HALT_DELAY."""
+        if not self.enabled or self.disabling:
+            return False
+        self.enabled = False
+        self.disabling = True
+        for m in self.all_machines():
+            m.stop()
+        self.cancel_countdown("system")
+        self.actions.cancel(None)
+        self.say("System disabled by user. Sending Alt-N to turn off enable TX...")
+        for m in self.all_machines():
+            self.send_key("n", "Alt-N sent to disable TX.", m.client_id, tx=False)
+
+        def halt():
+            self.say("Sending Alt-H to halt TX...")
+            for m in self.all_machines():
+                self.send_key("h", "Alt-H sent - Halt TX", m.client_id)
+            for m in self.all_machines():
+                m.in_qso = False
+                m.other_callsign = None
+                m.journal()
+            self.disabling = False
+            self.emit("enabled", enabled=False)
+        self.start_countdown("system", DISABLE_HALT_DELAY, "Disabling", halt)
+        return True
+
+    def command(self, action):
+        """Apply an operator command; returns the acknowledgement string."""
+        if action == "enable":
+            return "ok" if self.enable() else "ignored"
+        if action == "disable":
+            return "ok" if self.disable() else "ignored"
+        if action == "toggle":
+            # An explicit toggle from the operator, queued behind anything pending
+            self.send_key("n", "Alt-N sent - Tx toggled (command)")
+            return "ok"
+        return "unknown"
+
+    # State for the front ends
+
+    def last_activity(self):
+        """Loop time of the most recent QSO start or automatic TX enable."""
+        return max((m.last_qso_time for m in self.all_machines()), default=self.started)
+
+    def countdown(self):
+        """The most recently started countdown, or None."""
+        return next(reversed(self.countdowns.values()), None)
+
+    def qso_partner(self):
+        partners = [m.other_callsign for m in self.all_machines() if m.in_qso]
+        return partners[-1] if partners else None
+
+    def last_qso_partner(self):
+        partners = [m.last_qso_partner for m in self.all_machines() if m.last_qso_partner]
+        return partners[-1] if partners else None
+
+    def status(self):
+        now = self.loop.time()
+        countdown = self.countdown()
+        if self.enabled:
+            mins, secs = divmod(int(now - self.last_activity()), 60)
+            qso_timer_str = f"Last QSO: {mins}m {secs}s"
+        else:
+            qso_timer_str = ""
+        return {
+            'enabled': self.enabled,
+            'tx': any(m.tx_enabled for m in self.all_machines()),
+            'qso_partner': self.qso_partner(),
+            'last_qso_partner': self.last_qso_partner(),
+            'countdown_active': countdown is not None,
+            'countdown_max': countdown.seconds if countdown else 0,
+            'countdown_value': countdown.value(now) if countdown else 0,
+            'countdown_label': countdown.label + ":" if countdown else "",
+            'qso_timer_str': qso_timer_str,
+            'instances': self.instances(),
+            'activity': self.activity.summary(),
+        }
+
+    def instances(self):
+        return {
+            str(cid): {'tx': m.tx_enabled, 'qso_partner': m.other_callsign if m.in_qso else None,
+                       'last_qso_partner': m.last_qso_partner, 'cq': m.calling_cq,
+                       'clear_offset': m.clear_offset,
+                       'tx_period': None if m.tx_parity is None else ('odd' if m.tx_parity else 'even'),
+                       'last_slack': None if m.last_slack is None else round(m.last_slack, 3)}
+            for cid, m in self.machines.items()
+        }
@@ -0,0 +1,149 @@
+"""
+Single-threaded event loop: selector-driven readers plus a timer queue
+
+Used by the AutoTX73 scripts so the UDP socket keeps draining while delays and
+countdowns run.  Timers are cancellable handles kept in a heap; readers are
+plain callbacks invoked when their file object becomes readable.  Other
+threads (the HTTP server) hand work to the loop with call_soon_threadsafe().
+"""
+
+import heapq
+import itertools
+import selectors
+import socket
+import time
+from collections import deque
+
+
+class Timer:
+    __slots__ = ("when", "callback", "args", "interval", "cancelled", "_seq")
+
+    def __init__(self, when, callback, args, interval=None):
+        self.when = when
+        self.callback = callback
+        self.args = args
+        self.interval = interval
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def __lt__(self, other):
+        return (self.when, self._seq) < (other.when, other._seq)
+
+
+class Loop:
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.selector = selectors.DefaultSelector()
+        self._timers = []
+        self._seq = itertools.count()
+        self.running = False
+        self._pending = deque()
+        self._wake_r = self._wake_w = None
+        self.on_slip = None  # called with how late each timer ran, if set
+
+    def time(self):
+        return self.clock()
+
+    # Readers
+
+    def add_reader(self, fileobj, callback):
+        self.selector.register(fileobj, selectors.EVENT_READ, callback)
+
+    def remove_reader(self, fileobj):
+        try:
+            self.selector.unregister(fileobj)
+        except (KeyError, ValueError):
+            pass
+
+    # Timers
+
+    def _push(self, timer):
+        timer._seq = next(self._seq)
+        heapq.heappush(self._timers, timer)
+        return timer
+
+    def call_at(self, when, callback, *args):
+        return self._push(Timer(when, callback, args))
+
+    def call_later(self, delay, callback, *args):
+        return self.call_at(self.clock() + delay, callback, *args)
+
+    def call_every(self, interval, callback, *args):
+        """Run callback every `interval` seconds, first call one interval from now."""
+        return self._push(Timer(self.clock() + interval, callback, args, interval))
+
+    def timer_count(self):
+        return len(self._timers)
+
+    def reader_count(self):
+        return len(self.selector.get_map())
+
+    def next_deadline(self):
+        while self._timers and self._timers[0].cancelled:
+            heapq.heappop(self._timers)
+        return self._timers[0].when if self._timers else None
+
+    def run_timers(self):
+        now = self.clock()
+        while self._timers and self._timers[0].when <= now:
+            timer = heapq.heappop(self._timers)
+            if timer.cancelled:
+                continue
+            if self.on_slip is not None:
+                self.on_slip(now - timer.when)
+            if timer.interval is not None:
+                # Re-arm from the scheduled time so periodic ticks don't drift
+                timer.when += timer.interval
+                if timer.when <= now:
+                    timer.when = now + timer.interval
+                self._push(timer)
+            timer.callback(*timer.args)
+
+    def call_soon_threadsafe(self, callback, *args):
+        """Run callback on the loop thread; safe to call from any thread."""
+        if self._wake_r is None:
+            raise RuntimeError("enable_threadsafe() first")
+        self._pending.append((callback, args))
+        try:
+            self._wake_w.send(b"\0")
+        except BlockingIOError:
+            pass  # a wakeup is already queued
+
+    def enable_threadsafe(self):
+        # Call on the loop thread before handing the loop to other threads
+        if self._wake_r is None:
+            self._wake_r, self._wake_w = socket.socketpair()
+            self._wake_r.setblocking(False)
+            self._wake_w.setblocking(False)
+            self.add_reader(self._wake_r, self._run_pending)
+
+    def _run_pending(self, sock):
+        try:
+            while sock.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+        while self._pending:
+            callback, args = self._pending.popleft()
+            callback(*args)
+
+    # Running
+
+    def run_once(self, timeout=None):
+        deadline = self.next_deadline()
+        if deadline is not None:
+            wait = max(0.0, deadline - self.clock())
+            timeout = wait if timeout is None else min(timeout, wait)
+        for key, _ in self.selector.select(timeout):
+            key.data(key.fileobj)
+        self.run_timers()
+
+    def run(self):
+        self.running = True
+        while self.running:
+            self.run_once()
+
+    def stop(self):
+        self.running = False
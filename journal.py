@@ -0,0 +1,135 @@
+"""
+Crash-safe journal of the QSO state machines
+
+systemd restarts autotx73.py on failure; without a record of where each
+instance was, the new process starts from scratch: a QSO in progress is
+forgotten, the post-QSO re-enable never comes and the CQ restart waits a
+full idle period again.  The engine therefore appends every change of a
+machine's state (the QSO, the last QSO time, the pending post-QSO step and
+CQ window with their due times, in Unix time) to a journal (AUTOTX73_JOURNAL,
+default ~/.autotx73.journal; set it empty to turn it off).
+
+Records are JSON lines, buffered and written with one fsync per
+FLUSH_INTERVAL.  Every SNAPSHOT_EVERY records the file is compacted into a
+single snapshot line (write-then-rename), so it stays a few kilobytes and
+loads in well under a millisecond.  A line torn by a crash is skipped.
+While nothing changes the file's mtime is still refreshed every
+TOUCH_INTERVAL, so a journal untouched for MAX_AGE is known to be left over
+from an earlier session rather than from a crash.
+"""
+
+import json
+import os
+import sys
+import time
+
+JOURNAL_PATH = os.environ.get("AUTOTX73_JOURNAL", os.path.expanduser("~/.autotx73.journal"))
+FLUSH_INTERVAL = 1  # seconds between batched appends
+SNAPSHOT_EVERY = 200  # records between compactions
+TOUCH_INTERVAL = 60  # seconds between mtime refreshes while idle
+MAX_AGE = 900  # seconds; an older journal is from another session
+
+
+class Journal:
+    def __init__(self, path=JOURNAL_PATH, clock=time.time):
+        self.path = path
+        self.clock = clock
+        self.states = {}  # client id -> latest state
+        self.buffer = []  # lines waiting for flush()
+        self.since_snapshot = 0
+        self.written = 0
+        self.touched = clock()
+
+    def load(self, max_age=MAX_AGE, compact=True):
+        """Client id -> state as last journaled; empty if the journal is
+        missing or was last written over `max_age` seconds ago.  Then
+        compacts the file, unless just looking."""
+        states = {}
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                if self.clock() - os.fstat(f.fileno()).st_mtime > max_age:
+                    raise FileNotFoundError
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # torn by a crash mid-write
+                    if "snapshot" in record:
+                        states = dict(record["snapshot"])
+                    elif record.get("s") is None:
+                        states.pop(record.get("c"), None)
+                    else:
+                        states[record["c"]] = record["s"]
+        except FileNotFoundError:
+            pass
+        self.states = states
+        if compact:
+            # Start a clean file: no torn line for the next append to run into
+            self.snapshot()
+        return dict(states)
+
+    def record(self, client_id, state):
+        """Journal a machine's state (None: the instance is gone); a state
+        equal to the last one is not written again."""
+        if self.states.get(client_id) == state:
+            return False
+        if state is None:
+            self.states.pop(client_id, None)
+        else:
+            self.states[client_id] = state
+        self.buffer.append(json.dumps({"t": round(self.clock(), 1), "c": client_id, "s": state}) + "\n")
+        return True
+
+    def flush(self):
+        """Append the buffered records with one fsync; compact when due."""
+        if not self.buffer:
+            if self.clock() - self.touched >= TOUCH_INTERVAL:
+                self.touched = self.clock()
+                try:
+                    os.utime(self.path)
+                except OSError:
+                    pass
+            return 0
+        self.touched = self.clock()
+        lines, self.buffer = self.buffer, []
+        self.since_snapshot += len(lines)
+        if self.since_snapshot >= SNAPSHOT_EVERY:
+            self.snapshot()
+            return len(lines)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("".join(lines))
+            f.flush()
+            os.fsync(f.fileno())
+        self.written += len(lines)
+        return len(lines)
+
+    def snapshot(self):
+        """Replace the journal with one line holding every current state."""
+        self.buffer = []
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"t": round(self.clock(), 1), "snapshot": self.states}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self.since_snapshot = 0
+        self.touched = self.clock()
+
+    def close(self):
+        self.snapshot()
+
+
+def open_from_env():
+    """A Journal on AUTOTX73_JOURNAL, or None if it is turned off."""
+    if not JOURNAL_PATH:
+        return None
+    return Journal(JOURNAL_PATH)
+
+
+if __name__ == "__main__":
+    journal = Journal(sys.argv[1] if len(sys.argv) > 1 else JOURNAL_PATH)
+    start = time.perf_counter()
+    states = journal.load(max_age=float("inf"), compact=False)
+    print(f"{len(states)} instances, loaded in {(time.perf_counter() - start) * 1000:.2f} ms")
+    for client_id, state in states.items():
+        print(f"{client_id}: {json.dumps(state)}")
@@ -0,0 +1,206 @@
+"""
+Keystroke backends for driving JTDX / WSJT-X
+
+XTestBackend keeps one X display connection open and injects Alt+<key> with
+the XTEST extension, activating the JTDX window through an EWMH client
+message and waiting until the window manager reports it active before
+pressing anything, so an action costs no process spawns.  SubprocessBackend is the old
+wmctrl + xte path and is used when python-xlib or XTEST is not available.
+FakeBackend records keystrokes for headless runs.  udp_control provides a
+backend with the same interface that needs no X display at all.
+
+Backends are told about every received message through observe(); only the
+UDP backend uses it.
+"""
+
+import os
+import subprocess
+import time
+
+from windows import registry as default_registry
+
+# auto, xtest, xte or udp
+KEYSTROKE_BACKEND = os.environ.get("AUTOTX73_KEYS", "auto")
+FOCUS_TIMEOUT = 0.5  # seconds to wait for the window manager to move focus
+FOCUS_POLL = 0.005
+
+
+class SubprocessBackend:
+    name = "xte"
+
+    def __init__(self, windows=None):
+        self.windows = windows or default_registry
+
+    def observe(self, msg, addr, sock=None):
+        pass
+
+    def focus(self, client_id=None):
+        return bool(self.windows.focus_jtdx(client_id))
+
+    def press_alt(self, key):
+        subprocess.check_call(["xte", "keydown Alt_L", f"key {key}", "keyup Alt_L"])
+
+    def send_alt(self, key, client_id=None):
+        """Focus JTDX (the instance for client_id, if given) and press
+        Alt+key; False if there is no window."""
+        if not self.focus(client_id):
+            return False
+        self.press_alt(key)
+        return True
+
+
+class XTestBackend:
+    name = "xtest"
+
+    def __init__(self, windows=None, display=None):
+        from Xlib import X, XK, display as xdisplay, protocol
+        from Xlib.ext import xtest
+        self.X = X
+        self.protocol = protocol
+        self.xtest = xtest
+        self.windows = windows or default_registry
+        self.display = display or xdisplay.Display()
+        if not self.display.has_extension("XTEST"):
+            raise RuntimeError("X server has no XTEST extension")
+        self.root = self.display.screen().root
+        self.active_atom = self.display.intern_atom("_NET_ACTIVE_WINDOW")
+        self.alt = self.display.keysym_to_keycode(XK.XK_Alt_L)
+        self._keycodes = {}
+        self._XK = XK
+
+    def keycode(self, key):
+        code = self._keycodes.get(key)
+        if code is None:
+            code = self.display.keysym_to_keycode(self._XK.string_to_keysym(key))
+            self._keycodes[key] = code
+        return code
+
+    def observe(self, msg, addr, sock=None):
+        pass
+
+    def _has_focus(self, window_id):
+        prop = self.root.get_full_property(self.active_atom, self.X.AnyPropertyType)
+        if prop is not None and len(prop.value) and prop.value[0] == window_id:
+            return True
+        focus = self.display.get_input_focus().focus
+        return getattr(focus, "id", focus) == window_id
+
+    def _activate(self, wid):
+        """Activate the window and wait until it has focus; False if the
+        window manager has not given it focus within FOCUS_TIMEOUT."""
+        window_id = int(wid, 16)
+        window = self.display.create_resource_object("window", window_id)
+        window.get_geometry()  # raises BadWindow if the cached id went stale
+        if self._has_focus(window_id):
+            return True
+        # Same request wmctrl -ia sends: ask the window manager to activate it
+        event = self.protocol.event.ClientMessage(
+            window=window, client_type=self.active_atom,
+            data=(32, [2, self.X.CurrentTime, 0, 0, 0]))
+        mask = self.X.SubstructureRedirectMask | self.X.SubstructureNotifyMask
+        self.root.send_event(event, event_mask=mask)
+        self.display.flush()
+        # Keys pressed before the window manager has acted go to the old window
+        deadline = time.monotonic() + FOCUS_TIMEOUT
+        while not self._has_focus(window_id):
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(FOCUS_POLL)
+        return True
+
+    def _focus(self, lookup):
+        for attempt in range(2):
+            found = lookup()
+            if not found:
+                return None
+            wid = found if isinstance(found, str) else found[0]
+            try:
+                return found if self._activate(wid) else None
+            except Exception:
+                self.windows.invalidate()
+        return None
+
+    def focus(self, client_id=None):
+        return self._focus(lambda: self.windows.jtdx_window(client_id)) is not None
+
+    def focus_terminal(self):
+        """Give our terminal focus in-process; (wid, how) or None."""
+        return self._focus(self.windows.terminal_window)
+
+    def press_alt(self, key):
+        code = self.keycode(key)
+        fake = self.xtest.fake_input
+        fake(self.display, self.X.KeyPress, self.alt)
+        fake(self.display, self.X.KeyPress, code)
+        fake(self.display, self.X.KeyRelease, code)
+        fake(self.display, self.X.KeyRelease, self.alt)
+        self.display.sync()
+
+    def send_alt(self, key, client_id=None):
+        """Focus JTDX (the instance for client_id, if given) and press
+        Alt+key; False if there is no window."""
+        if not self.focus(client_id):
+            return False
+        self.press_alt(key)
+        return True
+
+
+class FakeBackend:
+    name = "fake"
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.sent = []  # (time, key)
+        self.targets = []  # client id of each entry in sent
+        self.configured = []  # (time, client id, fields) of each configure()
+        self.window_present = True
+
+    def observe(self, msg, addr, sock=None):
+        pass
+
+    def focus(self, client_id=None):
+        return self.window_present
+
+    def press_alt(self, key, client_id=None):
+        self.sent.append((self.clock(), key))
+        self.targets.append(client_id)
+
+    def send_alt(self, key, client_id=None):
+        if not self.focus(client_id):
+            return False
+        self.press_alt(key, client_id)
+        return True
+
+    def configure(self, client_id=None, **fields):
+        # Recorded only: the fake client never acts on it
+        self.configured.append((self.clock(), client_id, fields))
+        return True
+
+
+def default_backend(windows=None):
+    if KEYSTROKE_BACKEND == "udp":
+        from udp_control import UdpControlBackend
+        return UdpControlBackend()
+    if KEYSTROKE_BACKEND in ("auto", "xtest"):
+        try:
+            return XTestBackend(windows)
+        except Exception:
+            if KEYSTROKE_BACKEND == "xtest":
+                raise
+    return SubprocessBackend(windows)
+
+
+_backend = None
+
+def backend():
+    """The process-wide keystroke backend, created on first use."""
+    global _backend
+    if _backend is None:
+        _backend = default_backend()
+    return _backend
+
+def set_backend(new):
+    """Replace the process-wide backend (replay harness, tests); returns the old one."""
+    global _backend
+    old, _backend = _backend, new
+    return old
@@ -0,0 +1,162 @@
+"""
+In-process metrics: counters, histograms and gauges
+
+The hot paths only ever add to a counter or a histogram bucket (one dict
+lookup, a bisect over a dozen bucket bounds and two additions); the text is
+produced only when /metrics is scraped, and gauges are read only then.  Both
+happen on the loop thread, so nothing needs a lock.
+
+    registry.counter("autotx73_datagrams_total", "...", ("type",)).inc(type="Decode")
+    with timed(parse_seconds): ...
+
+render() gives the Prometheus text exposition format (/metrics); snapshot()
+a compact dict (/metrics.json).  Neither is part of the status snapshot,
+which is published on every change.
+"""
+
+import time
+from bisect import bisect_left
+
+# Seconds, from 10 us (a parse) to 10 s (a stuck X call)
+TIME_BUCKETS = (1e-5, 3e-5, 1e-4, 3e-4, 1e-3, 3e-3, 0.01, 0.03, 0.1, 0.3, 1, 3, 10)
+# Slack before a period start; negative means the action was late
+SLACK_BUCKETS = (-1, -0.5, -0.1, 0, 0.1, 0.25, 0.5, 0.75, 1, 1.5, 2, 5)
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{v}"' for n, v in zip(names, values)) + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = {}  # label values -> count
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[n] for n in self.labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def lines(self):
+        for key, value in sorted(self.values.items()):
+            yield f"{self.name}{_labels(self.labels, key)} {value}"
+
+    def snapshot(self):
+        if not self.labels:
+            return self.values.get((), 0)
+        return {",".join(map(str, key)): value for key, value in self.values.items()}
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=TIME_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.series = {}  # label values -> [bucket counts..., +Inf count, sum, max]
+
+    def observe(self, value, **labels):
+        key = tuple(labels[n] for n in self.labels)
+        s = self.series.get(key)
+        if s is None:
+            s = self.series[key] = [0] * (len(self.buckets) + 1) + [0.0, value]
+        s[bisect_left(self.buckets, value)] += 1
+        s[-2] += value
+        if value > s[-1]:
+            s[-1] = value
+
+    def lines(self):
+        n = len(self.buckets)
+        for key, s in sorted(self.series.items()):
+            total = 0
+            for bound, count in zip(self.buckets + ("+Inf",), s[:n + 1]):
+                total += count
+                yield f"{self.name}_bucket{_labels(self.labels + ('le',), key + (bound,))} {total}"
+            yield f"{self.name}_sum{_labels(self.labels, key)} {s[-2]:.6g}"
+            yield f"{self.name}_count{_labels(self.labels, key)} {total}"
+
+    def snapshot(self):
+        out = {}
+        n = len(self.buckets)
+        for key, s in self.series.items():
+            count = sum(s[:n + 1])
+            out[",".join(map(str, key)) or "all"] = {
+                'count': count, 'mean': round(s[-2] / count, 6), 'max': round(s[-1], 6)}
+        return out
+
+
+class Gauge:
+    """A value read only when metrics are collected; kind "counter" for
+    running totals kept elsewhere (a kernel drop counter)."""
+
+    def __init__(self, name, help, read, kind="gauge"):
+        self.name = name
+        self.help = help
+        self.read = read
+        self.kind = kind
+
+    def lines(self):
+        yield f"{self.name} {self.read()}"
+
+    def snapshot(self):
+        return self.read()
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def _add(self, metric):
+        # Asking twice for a name gives the same metric
+        return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help, labels=()):
+        return self._add(Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=TIME_BUCKETS):
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def gauge(self, name, help, read, kind="gauge"):
+        metric = self._add(Gauge(name, help, read, kind))
+        metric.read = read  # the latest reader wins (a new engine or loop)
+        return metric
+
+    def render(self):
+        """Prometheus text exposition format."""
+        out = []
+        for metric in self.metrics.values():
+            out.append(f"# HELP {metric.name} {metric.help}")
+            out.append(f"# TYPE {metric.name} {metric.kind}")
+            out.extend(metric.lines())
+        return "\n".join(out) + "\n"
+
+    def snapshot(self):
+        prefix = "autotx73_"
+        return {name[len(prefix):] if name.startswith(prefix) else name: metric.snapshot()
+                for name, metric in self.metrics.items()}
+
+
+registry = Registry()
+
+
+class timed:
+    """Context manager observing the elapsed time into a histogram."""
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram, **labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
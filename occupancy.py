@@ -0,0 +1,107 @@
+"""
+Audio-offset occupancy and the clearest TX offset
+
+Every decode reports its audio offset (Decode.delta_frequency, the lowest
+tone).  Occupancy marks the bins a signal covers across the LOW_HZ-HIGH_HZ
+passband for the current T/R period; when the period changes, the histogram
+of earlier periods decays by DECAY per period and the new one is added, so
+a frequency that was busy a few minutes ago slowly becomes free again.
+
+clearest() slides a window of one signal plus a guard band over the
+histogram and picks the quietest spot, preferring the current offset and
+then the nearest one on ties.  With NumPy it is a cumsum and an argmin;
+without it, one running-sum pass in Python.  Either way it takes a small
+fraction of a millisecond, so the suggestion is refreshed every period.
+"""
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+LOW_HZ = 200
+HIGH_HZ = 3000
+BIN_HZ = 10
+DECAY = 0.7  # weight kept per T/R period
+GUARD_HZ = 20  # clear space wanted either side of our signal
+# Occupied bandwidth per mode (8-GFSK FT8: 50 Hz, 4-GFSK FT4: 83 Hz)
+SIGNAL_HZ = {"FT8": 50, "FT4": 90}
+DEFAULT_SIGNAL_HZ = 50
+BINS = (HIGH_HZ - LOW_HZ) // BIN_HZ
+
+
+class Occupancy:
+    def __init__(self):
+        self.period_ms = None  # Decode.time_ms of the period being collected
+        if np is not None:
+            self.history = np.zeros(BINS)
+            self.current = np.zeros(BINS)
+        else:
+            self.history = [0.0] * BINS
+            self.current = [0.0] * BINS
+        self.signals = 0  # decodes in the current period
+
+    def add(self, time_ms, df, width=DEFAULT_SIGNAL_HZ, periods=1):
+        """Mark one decode; `periods` is how many T/R periods have passed
+        when `time_ms` starts a new one (for the decay)."""
+        if time_ms != self.period_ms:
+            if self.period_ms is not None:
+                self.roll(periods)
+            self.period_ms = time_ms
+        lo = max(0, (df - LOW_HZ) // BIN_HZ)
+        hi = min(BINS, (df + width - LOW_HZ) // BIN_HZ + 1)
+        if lo >= hi:
+            return
+        if np is not None:
+            self.current[lo:hi] += 1
+        else:
+            current = self.current
+            for i in range(lo, hi):
+                current[i] += 1
+        self.signals += 1
+
+    def roll(self, periods=1):
+        """Fold the finished period into the decayed history."""
+        decay = DECAY ** max(1, periods)
+        if np is not None:
+            self.history *= decay
+            self.history += self.current
+            self.current[:] = 0
+        else:
+            self.history = [h * decay + c for h, c in zip(self.history, self.current)]
+            self.current = [0.0] * BINS
+        self.signals = 0
+
+    def weights(self):
+        """History plus the period in progress."""
+        if np is not None:
+            return self.history + self.current
+        return [h + c for h, c in zip(self.history, self.current)]
+
+    def clearest(self, width=DEFAULT_SIGNAL_HZ, current=None):
+        """(offset Hz, occupancy there, occupancy at `current`) for the
+        quietest spot for a signal `width` Hz wide."""
+        span = (width + 2 * GUARD_HZ + BIN_HZ - 1) // BIN_HZ
+        w = self.weights()
+        at = None
+        if current is not None and LOW_HZ + GUARD_HZ <= current <= HIGH_HZ - width - GUARD_HZ:
+            at = (current - GUARD_HZ - LOW_HZ) // BIN_HZ
+        if np is not None:
+            cs = np.concatenate(((0.0,), np.cumsum(w)))
+            sums = cs[span:] - cs[:-span]
+            # Ties go to the window nearest the current offset
+            if at is not None:
+                sums = sums + np.abs(np.arange(len(sums)) - at) * 1e-9
+            best = int(np.argmin(sums))
+            best_sum = float(sums[best])
+        else:
+            total = sum(w[:span])
+            best, best_sum = 0, None
+            for i in range(len(w) - span + 1):
+                if i:
+                    total += w[i + span - 1] - w[i - 1]
+                score = total + (abs(i - at) * 1e-9 if at is not None else 0)
+                if best_sum is None or score < best_sum:
+                    best, best_sum = i, score
+        here = sum(w[at:at + span]) if at is not None else None
+        return LOW_HZ + best * BIN_HZ + GUARD_HZ, round(float(best_sum), 2), None if here is None else round(float(here), 2)
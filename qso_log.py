@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+ADIF QSO log with an in-memory worked-before index
+
+Completed QSOs are appended to an ADIF file (AUTOTX73_ADIF, default
+~/autotx73.adi; set it empty to turn logging off) in batches by flush(),
+which the engine runs from a loop timer.  A QSO the engine saw finish is
+held for LOGGED_GRACE seconds first: if JTDX / WSJT-X sends its own QSO Logged
+message for the same call in that time, that (more complete) record is
+written instead, and a finish for a call the client logged in the last
+LOGGED_GRACE seconds (JTDX often logs as our RR73 goes out, before the
+finish is seen) is not written at all, so a contact is never logged twice.
+
+The index is a set of call/band/mode keys (plus call/band and call sets),
+updated as soon as a QSO is added, so worked_before() is one hash lookup.  It is saved next to the
+log (FILE.idx) on close; at start-up only what was appended to the log since
+is parsed, so even a few hundred thousand contacts load in a fraction of a
+second.  Without a usable cache the whole file is parsed once.
+
+    python3 qso_log.py [--file FILE] [CALL ...]    summary and worked-before lookups
+"""
+
+import argparse
+import os
+import re
+import sys
+import time
+
+ADIF_PATH = os.environ.get("AUTOTX73_ADIF", os.path.expanduser("~/autotx73.adi"))
+LOGGED_GRACE = 120  # seconds to wait for the client's own QSO Logged
+FLUSH_INTERVAL = 5  # seconds between batched appends
+CACHE_TAIL = 64  # bytes of the log kept in the index cache to validate it
+
+ADIF_HEADER = "AutoTX73 QSO log\n<ADIF_VER:5>3.1.4 <PROGRAMID:8>AutoTX73 <EOH>\n"
+
+# (lowest Hz, highest Hz, ADIF band)
+BANDS = (
+    (1800000, 2000000, "160m"), (3500000, 4000000, "80m"), (5060000, 5450000, "60m"),
+    (7000000, 7300000, "40m"), (10100000, 10150000, "30m"), (14000000, 14350000, "20m"),
+    (18068000, 18168000, "17m"), (21000000, 21450000, "15m"), (24890000, 24990000, "12m"),
+    (28000000, 29700000, "10m"), (50000000, 54000000, "6m"), (70000000, 71000000, "4m"),
+    (144000000, 148000000, "2m"), (420000000, 450000000, "70cm"),
+)
+
+# Only the tags the index needs, matched on the lower-cased file; none of
+# their values can contain "<", so the value is everything up to the next tag
+_INDEX_TAG = re.compile(rb"<(call|band|mode|submode|freq|eor)(?::\d+[^>]*)?>([^<]*)")
+# ADIF modes for WSJT-X mode names that are submodes in ADIF
+_SUBMODES = {"FT4": "MFSK", "JS8": "MFSK"}
+
+
+def band_for(hz):
+    """ADIF band name for a frequency in Hz, or None."""
+    if not hz:
+        return None
+    for lo, hi, name in BANDS:
+        if lo <= hz <= hi:
+            return name
+    return None
+
+
+def _key(call, band, mode):
+    # Index keys are "CALL\tband\tMODE" strings: a set of them is far quicker
+    # to build and to save than tuples
+    return f"{(call or '').upper()}\t{(band or '').lower()}\t{(mode or '').upper()}"
+
+
+def _field(name, value):
+    value = str(value)
+    return f"<{name}:{len(value.encode())}>{value} "
+
+
+def adif_record(qso):
+    """One ADIF record (with <EOR>) from a QSO dict."""
+    mode = (qso.get("mode") or "").upper()
+    parts = [_field("CALL", qso["call"])]
+    if qso.get("grid"):
+        parts.append(_field("GRIDSQUARE", qso["grid"]))
+    if mode in _SUBMODES:
+        parts += [_field("MODE", _SUBMODES[mode]), _field("SUBMODE", mode)]
+    elif mode:
+        parts.append(_field("MODE", mode))
+    if qso.get("frequency"):
+        parts.append(_field("FREQ", f"{qso['frequency'] / 1e6:.6f}"))
+    if qso.get("band"):
+        parts.append(_field("BAND", qso["band"]))
+    time_on = qso.get("time_on") or qso.get("time_off")
+    if time_on:
+        t = time.gmtime(time_on)
+        parts += [_field("QSO_DATE", time.strftime("%Y%m%d", t)), _field("TIME_ON", time.strftime("%H%M%S", t))]
+    if qso.get("time_off"):
+        t = time.gmtime(qso["time_off"])
+        parts += [_field("QSO_DATE_OFF", time.strftime("%Y%m%d", t)), _field("TIME_OFF", time.strftime("%H%M%S", t))]
+    for name, key in (("RST_SENT", "report_sent"), ("RST_RCVD", "report_received"),
+                      ("TX_PWR", "tx_power"), ("NAME", "name"), ("COMMENT", "comments"),
+                      ("STATION_CALLSIGN", "my_call"), ("MY_GRIDSQUARE", "my_grid"),
+                      ("OPERATOR", "operator_call")):
+        if qso.get(key):
+            parts.append(_field(name, qso[key]))
+    return "".join(parts) + "<EOR>\n"
+
+
+def iter_index_keys(data):
+    """Yield the index key of each record in ADIF bytes."""
+    call = band = mode = submode = freq = None
+    for tag, value in _INDEX_TAG.findall(data.lower()):
+        if tag == b"eor":
+            if call:
+                if not band and freq:
+                    try:
+                        band = band_for(int(float(freq) * 1e6))
+                    except ValueError:
+                        pass
+                else:
+                    band = (band or b"").strip().decode()
+                mode = (submode or mode or b"").strip().decode(errors="replace")
+                yield _key(call.strip().decode(errors="replace"), band, mode)
+            call = band = mode = submode = freq = None
+        elif tag == b"call":
+            call = value
+        elif tag == b"band":
+            band = value
+        elif tag == b"mode":
+            mode = value
+        elif tag == b"submode":
+            submode = value
+        else:
+            freq = value
+
+
+class QsoLog:
+    def __init__(self, path=ADIF_PATH, clock=time.time):
+        self.path = path
+        self.clock = clock
+        self.keys = set()  # "CALL\tband\tMODE"
+        self.call_bands = set()  # "CALL\tband"
+        self.calls = set()
+        self.pending = []  # [due, qso] waiting for flush()
+        self.logged = {}  # call -> when the client last logged it
+        self.written = 0
+        self.load()
+
+    @property
+    def cache_path(self):
+        return self.path + ".idx"
+
+    def load(self):
+        """Build the index: from the cache for the part of the file it
+        covers, parsing only what was appended since."""
+        keys, offset = self._read_cache()
+        try:
+            with open(self.path, "rb") as f:
+                f.seek(offset)
+                data = f.read()
+        except FileNotFoundError:
+            return
+        new = set(iter_index_keys(data))
+        self._index_keys(keys | new)
+        if new - keys:
+            self.save_cache()
+
+    def _read_cache(self):
+        # Cache layout: offset, the CACHE_TAIL bytes before it, then the keys.
+        # The tail check catches a log that was replaced rather than appended to
+        try:
+            with open(self.cache_path, "rb") as f:
+                offset, tail, keys = f.read().split(b"\0", 2)
+            offset = int(offset)
+            with open(self.path, "rb") as f:
+                f.seek(max(0, offset - len(tail)))
+                if f.read(len(tail)) == tail and offset <= os.fstat(f.fileno()).st_size:
+                    return set(keys.decode().split("\n")) - {""}, offset
+        except (OSError, ValueError):
+            pass
+        return set(), 0
+
+    def save_cache(self):
+        try:
+            with open(self.path, "rb") as f:
+                offset = f.seek(0, os.SEEK_END)
+                f.seek(max(0, offset - CACHE_TAIL))
+                tail = f.read()
+            tmp = self.cache_path + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(b"%d\0%s\0" % (offset, tail.replace(b"\0", b"")))
+                f.write("\n".join(self.keys).encode())
+            os.replace(tmp, self.cache_path)
+        except OSError:
+            pass
+
+    def _index_keys(self, keys):
+        self.keys |= keys
+        self.call_bands |= {k.rpartition("\t")[0] for k in keys}
+        self.calls |= {k.partition("\t")[0] for k in keys}
+
+    def _index(self, call, band, mode):
+        key = _key(call, band, mode)
+        self.keys.add(key)
+        self.call_bands.add(key.rpartition("\t")[0])
+        self.calls.add(key.partition("\t")[0])
+
+    @property
+    def count(self):
+        """Distinct call/band/mode combinations in the log."""
+        return len(self.keys)
+
+    def worked_before(self, call, band=None, mode=None):
+        """True if `call` is in the log (on `band` and in `mode`, when given)."""
+        call = (call or "").upper()
+        if band and mode:
+            return _key(call, band, mode) in self.keys
+        if band:
+            return f"{call}\t{band.lower()}" in self.call_bands
+        if mode:
+            return any(_key(call, name, mode) in self.keys for _, _, name in BANDS)
+        return call in self.calls
+
+    def add(self, qso, hold=0):
+        """Index a QSO now and append it to the file at the next flush after
+        `hold` seconds."""
+        if not qso.get("band"):
+            qso["band"] = band_for(qso.get("frequency"))
+        self._index(qso["call"], qso.get("band"), qso.get("mode"))
+        self.pending.append([self.clock() + hold, qso])
+
+    def add_finished(self, qso):
+        """A QSO the engine saw finish; the client's own log entry wins,
+        whether it comes before or after."""
+        logged = self.logged.get(qso["call"].upper())
+        if logged is not None and self.clock() - logged < LOGGED_GRACE:
+            return False
+        self.add(qso, hold=LOGGED_GRACE)
+        return True
+
+    def add_logged(self, qso):
+        """A QSO the client logged: replaces a held entry for the same call."""
+        call = qso["call"].upper()
+        now = self.clock()
+        self.pending = [p for p in self.pending if p[1]["call"].upper() != call]
+        self.logged = {c: t for c, t in self.logged.items() if now - t < LOGGED_GRACE}
+        self.logged[call] = now
+        self.add(qso)
+
+    def flush(self, everything=False):
+        """Append every due QSO in one write."""
+        now = self.clock()
+        due = [qso for when, qso in self.pending if everything or when <= now]
+        if not due:
+            return 0
+        self.pending = [p for p in self.pending if not (everything or p[0] <= now)]
+        new_file = not os.path.exists(self.path)
+        with open(self.path, "a", encoding="utf-8") as f:
+            if new_file:
+                f.write(ADIF_HEADER)
+            f.write("".join(adif_record(qso) for qso in due))
+            f.flush()
+            os.fsync(f.fileno())
+        self.written += len(due)
+        return len(due)
+
+    def close(self):
+        self.flush(everything=True)
+        self.save_cache()
+
+
+def open_from_env():
+    """A QsoLog on AUTOTX73_ADIF, or None if logging is turned off."""
+    if not ADIF_PATH:
+        return None
+    try:
+        return QsoLog(ADIF_PATH)
+    except OSError as e:
+        print(f"✘  QSO log disabled: {e}", file=sys.stderr)
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarise an AutoTX73 ADIF log")
+    parser.add_argument("--file", default=ADIF_PATH)
+    parser.add_argument("calls", nargs="*", help="calls to look up")
+    args = parser.parse_args()
+    start = time.perf_counter()
+    log = QsoLog(args.file)
+    elapsed = time.perf_counter() - start
+    print(f"{len(log.calls)} calls, {log.count} call/band/mode entries, loaded in {elapsed * 1000:.0f} ms")
+    for call in args.calls:
+        prefix = call.upper() + "\t"
+        entries = sorted(k[len(prefix):].replace("\t", " ") for k in log.keys if k.startswith(prefix))
+        print(f"{call.upper():<12} " + (", ".join(entries) or "not worked"))
+
+
+if __name__ == "__main__":
+    main()
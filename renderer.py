@@ -0,0 +1,134 @@
+"""
+Dirty-region curses renderer for the AutoTX73 UI
+
+The renderer is the only code that touches curses.  Each frame it builds the
+spans for every screen region (border, header, messages, countdown bar,
+footer) from the UI state, compares them with what it drew last time and
+rewrites only the regions that changed, then flushes once with
+noutrefresh()/doupdate().  Everything is padded to a fixed width, so nothing
+needs clearing between frames; the interior is filled only after a resize.
+"""
+
+import curses
+
+BORDER = 2  # Double border all around
+
+
+class Renderer:
+    def __init__(self, stdscr):
+        self.stdscr = stdscr
+        curses.start_color()
+        curses.use_default_colors()
+        curses.init_pair(1, curses.COLOR_WHITE, curses.COLOR_RED)   # Enabled: white on red
+        curses.init_pair(2, curses.COLOR_WHITE, curses.COLOR_GREEN) # Disabled: white on green
+        curses.init_pair(3, curses.COLOR_BLACK, curses.COLOR_WHITE) # Countdown/message: black on white
+        curses.init_pair(4, curses.COLOR_BLACK, curses.COLOR_WHITE) # Main area: black on white
+        self.size = None
+        self.drawn = {}  # region name -> spans last written
+        self.frames = 0
+        self.writes = 0
+
+    def invalidate(self):
+        """Force a full repaint on the next frame (e.g. after a resize)."""
+        self.size = None
+
+    def _put(self, y, x, text, attr):
+        self.writes += 1
+        try:
+            self.stdscr.addstr(y, x, text, attr)
+        except curses.error:
+            # Writing the bottom-right cell moves the cursor off screen; the
+            # text is still drawn
+            pass
+
+    def render(self, ui):
+        size = self.stdscr.getmaxyx()
+        if size != self.size:
+            self.size = size
+            self.drawn = {}
+            self.stdscr.erase()
+            max_y, max_x = size
+            main = curses.color_pair(4)
+            for y in range(BORDER, max_y - BORDER):
+                self._put(y, BORDER, " " * (max_x - 2 * BORDER), main)
+        changed = False
+        for name, spans in self.regions(ui):
+            if self.drawn.get(name) != spans:
+                for span in spans:
+                    self._put(*span)
+                self.drawn[name] = spans
+                changed = True
+        if changed:
+            self.frames += 1
+            self.stdscr.noutrefresh()
+            curses.doupdate()
+        return changed
+
+    def regions(self, ui):
+        max_y, max_x = self.size
+        inner = max_x - 2 * BORDER
+        text_width = max(0, inner - 4)
+        main = curses.color_pair(4)
+        color = curses.color_pair(1) if ui.enabled else curses.color_pair(2)
+
+        # Border rows and columns; row 0 belongs to the header
+        border = [(max_y - 1 - y, 0, " " * max_x, color) for y in range(BORDER)]
+        border.append((1, 0, " " * max_x, color))
+        for y in range(BORDER, max_y - BORDER):
+            border.append((y, 0, " " * BORDER, color))
+            border.append((y, max_x - BORDER, " " * BORDER, color))
+        yield "border", border
+
+        # Top row: QSO/CQ status on the left, timer and TX status on the right
+        elapsed = int(ui.idle_seconds())
+        mins, secs = divmod(elapsed, 60)
+        timer_str = f"Time since last TX: {mins:02d}:{secs:02d}"
+        tx_str = "TX: ON" if ui.tx_enabled else "TX: OFF"
+        qso_str = f"QSO: {ui.qso_partner}" if ui.qso_partner else "QSO: None"
+        if len(ui.instances) > 1:
+            # One "id: partner/TX" entry per connected instance
+            qso_str = "  ".join(
+                f"{cid}: {inst['qso_partner'] or '-'}{'*' if inst['tx'] else ''}"
+                for cid, inst in ui.instances.items())
+        cq_str = "CQ: ACTIVE" if ui.cq_active else "CQ: -"
+        yield "header", [
+            (0, 0, " " * max_x, color),
+            (0, BORDER + 2, (qso_str + "   " + cq_str)[:max(0, max_x - len(timer_str) - len(tx_str) - BORDER - 7)], main),
+            (0, max_x - len(timer_str) - len(tx_str) - 4, timer_str + "  " + tx_str, main),
+        ]
+
+        # Dynamic message area: centered, up to 10 lines, never overlapping border or controls
+        msg_area_height = min(10, max_y - 2 * BORDER - 7)
+        msg_area_top = BORDER + (max_y - 2 * BORDER - msg_area_height - 7) // 2
+        msgs_to_show = list(ui.messages)[-msg_area_height:] if msg_area_height > 0 else []
+        msgs_to_show = [""] * (msg_area_height - len(msgs_to_show)) + msgs_to_show
+        yield "messages", [
+            (msg_area_top + i, BORDER + 2, msg.ljust(text_width)[:text_width], main)
+            for i, msg in enumerate(msgs_to_show)
+        ]
+
+        # Countdown bar just above the border; a blank line when idle
+        bar_y = max_y - BORDER - 1
+        countdown = [(bar_y, BORDER, " " * inner, main)]
+        if ui.countdown_active:
+            bar_width = 30 if ui.countdown_max >= 10 else 20
+            bar_x = max_x // 2 - bar_width // 2
+            label = ui.countdown_label
+            filled = int(bar_width * ui.countdown_value / ui.countdown_max) if ui.countdown_max > 0 else bar_width
+            time_str = f"{ui.countdown_value}/{ui.countdown_max}s"
+            countdown += [
+                (bar_y, bar_x - len(label) - 2, label, main),
+                (bar_y, bar_x, ("█" * filled).ljust(bar_width), curses.color_pair(3)),
+                (bar_y, bar_x + bar_width + 2, time_str.ljust(len(f"{ui.countdown_max}/{ui.countdown_max}s")), main),
+            ]
+        yield "countdown", countdown
+
+        # Bottom: controls (no status messages or bar here), with the band
+        # activity of the busiest band/mode next to the system status
+        status = f"System status: {'ENABLED' if ui.enabled else 'DISABLED'}"
+        if ui.activity:
+            status += "   " + ui.activity[0]
+        yield "footer", [
+            (max_y - BORDER - 3, BORDER + 2, status.ljust(text_width)[:text_width], main),
+            (max_y - BORDER - 2, BORDER + 2, "[E]nable  [D]isable  [Q]uit".ljust(text_width), main),
+        ]
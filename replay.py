@@ -0,0 +1,501 @@
+#!/usr/bin/env python3
+"""
+Replay harness for the QSO automation logic
+
+Feeds a datagram stream -- a capture file or a synthetic scenario -- through
+the same engine the headless script and the UI run, on an event loop
+driven by a virtual clock and with a FakeBackend recording keystrokes.  Hours
+of operation replay in well under a second, and the resulting Alt-6 / Alt-N /
+Alt-H sequence can be compared with an expected one.
+
+    python3 replay.py CAPTURE [--until SECONDS] [--seed N] [-v]
+    python3 replay.py --selftest
+"""
+
+import argparse
+import contextlib
+import http.client
+import io
+import os
+import random
+import socket
+import sys
+import tempfile
+
+import engine
+import journal
+import keystrokes
+import qso_log
+import status_http
+import udp_control
+import windows
+import wsjtx_protocol as proto
+from engine import Engine
+from eventloop import Loop
+
+CLIENT_ID = "JTDX"
+
+
+class VirtualClock:
+    def __init__(self, start=0.0):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+
+class Replay:
+    """One engine on a virtual clock with a fake keystroke backend."""
+
+    def __init__(self, seed=0, start=0.0, verbose=False, align=False):
+        random.seed(seed)
+        self.clock = VirtualClock(start)
+        self.loop = Loop(clock=self.clock)
+        self.keys = keystrokes.FakeBackend(clock=self.clock)
+        self._previous_backend = keystrokes.set_backend(self.keys)
+        # The virtual clock doubles as UTC (0 is a period start); T/R period
+        # alignment is off unless a scenario asks for it
+        self.engine = Engine(self.loop, enabled=True, wall=self.clock, align_slots=align)
+        if verbose:
+            from autotx73 import Console
+            Console(self.engine)
+
+    def close(self):
+        keystrokes.set_backend(self._previous_backend)
+
+    def advance(self, until):
+        """Fire every timer due up to `until`, moving the clock as they run."""
+        while True:
+            deadline = self.loop.next_deadline()
+            if deadline is None or deadline > until:
+                break
+            self.clock.now = max(self.clock.now, deadline)
+            self.loop.run_timers()
+        self.clock.now = max(self.clock.now, until)
+
+    def feed(self, events, until=None, commands=(), targets=False):
+        """Replay (time, datagram) pairs and (time, operator command) pairs,
+        then run on to `until`."""
+        timeline = sorted([(when, False, data) for when, data in events]
+                          + [(when, True, action) for when, action in commands], key=lambda e: e[0])
+        for when, command, item in timeline:
+            self.advance(when)
+            if command:
+                self.engine.command(item)
+            else:
+                self.engine.handle_datagram(item)
+        if until is not None:
+            self.advance(until)
+        return self.actions(targets)
+
+    def actions(self, targets=False):
+        """Keystrokes sent so far as (seconds, key), or with `targets`
+        (seconds, key, client id)."""
+        if targets:
+            return [(round(t, 3), key, cid) for (t, key), cid in zip(self.keys.sent, self.keys.targets)]
+        return [(round(t, 3), key) for t, key in self.keys.sent]
+
+
+def run(events, until=None, seed=0, quiet=True, align=False, commands=(), targets=False):
+    """Replay events through a fresh engine and return its actions."""
+    replay = Replay(seed, verbose=not quiet, align=align)
+    try:
+        return replay.feed(events, until, commands, targets)
+    finally:
+        replay.close()
+
+
+def assert_actions(actual, expected, tolerance=0.0):
+    """Raise AssertionError unless both action lists match key for key and
+    each time is within `tolerance` seconds."""
+    problems = []
+    for i, (a, e) in enumerate(zip(actual, expected)):
+        if a[1:] != e[1:] or abs(a[0] - e[0]) > tolerance:
+            to = (lambda x: f" to {x[2]}" if len(x) > 2 else "")
+            problems.append(f"  #{i}: got Alt-{a[1]}{to(a)} at {a[0]}s, expected Alt-{e[1]}{to(e)} at {e[0]}s")
+    if len(actual) != len(expected):
+        problems.append(f"  got {len(actual)} actions, expected {len(expected)}")
+    if problems:
+        raise AssertionError("action sequence differs:\n" + "\n".join(problems))
+
+
+# Synthetic traffic
+
+def decode(when, message, snr=-10, delta_frequency=1500, client_id=CLIENT_ID):
+    time_ms = int(when * 1000) % 86400000
+    return when, proto.encode(proto.Decode(client_id, True, time_ms, snr, 0.1,
+                                           delta_frequency, "~", message, False, False))
+
+
+def status(when, tx_enabled=True, tx_message=None, client_id=CLIENT_ID, **fields):
+    values = dict(dial_frequency=14074000, mode="FT8", dx_call="", report="",
+                  tx_mode="FT8", tx_enabled=tx_enabled, transmitting=False,
+                  decoding=False, rx_df=1500, tx_df=1500, de_call="5Z4XB",
+                  de_grid="KI03", dx_grid="", tx_watchdog=False, sub_mode="",
+                  fast_mode=False, special_op_mode=0, frequency_tolerance=0,
+                  tr_period=15, configuration_name="", tx_message=tx_message)
+    values.update(fields)
+    return when, proto.encode(proto.Status(client_id, **values))
+
+
+def qso_logged(when, call, client_id=CLIENT_ID):
+    return when, proto.encode(proto.QsoLogged(
+        client_id, when, call, "JO62", 14075500, "FT8", "-10", "-12", "", "", "",
+        when - 60, "", "5Z4XB", "KI03", "", "", ""))
+
+
+def load_capture(path):
+    """Capture file records as (seconds from first datagram, datagram)."""
+    from capture import iter_capture
+    events = list(iter_capture(path))
+    if not events:
+        return []
+    t0 = events[0][0]
+    return [(when - t0, data) for when, data in events]
+
+
+# Built-in regression scenarios: (name, events, until, expected actions),
+# plus run() options for some
+
+def scenarios():
+    idle = engine.CQ_RESTART_IDLE
+    window = engine.CQ_RESTART_WINDOW
+    post = engine.POST_QSO_TX_DELAY
+    yield ("idle CQ restart", [], 2 * (idle + window) + 1,
+           [(idle, "6"), (idle + window, "n"),
+            (2 * idle + window, "6"), (2 * (idle + window), "n")])
+    yield ("QSO then post-QSO re-enable",
+           [decode(10, "5Z4XB DL1ABC JO62"), decode(40, "5Z4XB DL1ABC RR73"),
+            decode(55, "5Z4XB DL1ABC 73")],
+           40 + post + idle + window,
+           [(40 + post, "n"), (40 + post + idle, "6"), (40 + post + idle + window, "n")])
+    yield ("own CQ seen in restart window",
+           [status(idle + 15, tx_message="CQ 5Z4XB KI03")], 2 * idle + 30,
+           [(idle, "6"), (2 * idle + 15, "6")])
+    # JTDX replays its decode history after the QSO; nothing may fire again
+    history = [decode(10, "5Z4XB DL1ABC JO62"), decode(40, "5Z4XB DL1ABC RR73")]
+    yield ("replayed decodes are ignored",
+           history + [(40 + post + 5, data) for _, data in history],
+           40 + post + 60,
+           [(40 + post, "n")])
+    yield ("repeated 73s only re-enable once",
+           [decode(10, "5Z4XB DL1ABC JO62")]
+           + [decode(40 + 15 * i, "5Z4XB DL1ABC RR73") for i in range(4)],
+           40 + post + 1,
+           [(40 + post, "n")])
+    yield ("two instances keep separate QSO state",
+           [decode(10, "5Z4XB DL1ABC JO62"), decode(20, "5Z4XB G4XYZ IO91", client_id="WSJT-X"),
+            decode(40, "5Z4XB DL1ABC RR73"), decode(70, "5Z4XB G4XYZ RR73", client_id="WSJT-X")],
+           70 + post + 1,
+           [(40 + post, "n"), (70 + post, "n")])
+    # Alt-N toggles, so it is only sent when the last Status shows TX off
+    yield ("no Alt-N while Status shows TX on",
+           [status(5, tx_enabled=True), decode(10, "5Z4XB DL1ABC JO62"), decode(40, "5Z4XB DL1ABC RR73")],
+           40 + post + 1,
+           [])
+    # Operator disable and enable act on each instance by its own TX state
+    yield ("operator commands target each instance",
+           [status(5, tx_enabled=False), status(6, tx_enabled=True, client_id="WSJT-X")],
+           45,
+           [(10, "n", "WSJT-X"), (15, "h", "JTDX"), (15, "h", "WSJT-X"),
+            (30, "6", "JTDX"), (30, "6", "WSJT-X"), (40, "n", "JTDX"), (40, "n", "WSJT-X")],
+           {"commands": [(10, "disable"), (30, "enable")], "targets": True})
+    # Two callers in one period: the stronger one is worked, whatever the
+    # packet order, and the other's RR73 to someone else does not finish it
+    yield ("strongest caller picked from a pileup",
+           [decode(10, "5Z4XB DL1ABC JO62", snr=-18), decode(10.05, "5Z4XB G4XYZ IO91", snr=-3),
+            decode(40, "5Z4XB DL1ABC RR73", snr=-18), decode(55, "5Z4XB G4XYZ RR73", snr=-3)],
+           55 + post + 1,
+           [(55 + post, "n")])
+    # The client ignores our request to answer the stronger caller and
+    # keeps working DL1ABC: its Status DX call wins, so DL1ABC's RR73
+    # finishes the QSO
+    yield ("client's DX call wins over our pick",
+           [decode(10, "5Z4XB DL1ABC JO62", snr=-18), decode(10.05, "5Z4XB G4XYZ IO91", snr=-3),
+            status(12, tx_enabled=False, dx_call="DL1ABC"), decode(40, "5Z4XB DL1ABC RR73", snr=-18)],
+           40 + post + 1,
+           [(40 + post, "n")])
+    # Idle restarts until the 60-minute mark, then a QSO whose finish takes
+    # the random break (delay drawn from the same seeded generator)
+    brk = random.Random(0).randint(*engine.RANDOM_BREAK_RANGE)
+    start = engine.RANDOM_BREAK_AFTER + 100
+    expected = []
+    t = idle
+    while t < start:
+        expected.append((t, "6"))
+        if t + window < start:
+            expected.append((t + window, "n"))
+        t += idle + window
+    expected += [(start + 30 + brk, "6"),
+                 (start + 30 + brk + engine.RANDOM_BREAK_TX_DELAY, "n")]
+    # DL1ABC calls us in even periods, so we transmit in odd ones: each
+    # action fires a margin ahead of the next odd period after its delay
+    margin = engine.tr_period.SLOT_MARGIN
+    yield ("actions aligned to our TX periods",
+           [decode(10, "5Z4XB DL1ABC JO62"), decode(30, "5Z4XB DL1ABC RR73")],
+           480,
+           [(105 - margin, "n"), (405 - margin, "6"), (465 - margin, "n")],
+           {"align": True})
+    yield ("random break after 60 minutes",
+           [decode(start, "5Z4XB DL1ABC JO62"), decode(start + 30, "5Z4XB DL1ABC RR73")],
+           start + 30 + brk + engine.RANDOM_BREAK_TX_DELAY + 1, expected)
+
+
+# Window lookup: cached ids, looked up again once they go stale
+
+def window_registry():
+    """The registry finds each instance's window by rig name and the
+    terminal by its class, lists windows only when nothing is cached, and
+    looks up again when activating a cached id fails.  Returns the
+    problems found."""
+    problems = []
+    fake = windows.FakeBackend()
+    fake.add("0x1", "JTDX   by HF community - rig A")
+    fake.add("0x2", "WSJT-X   v2.6.1   by K1JT et al. - rig B", wm_class="wsjtx.wsjtx")
+    fake.add("0x3", "pi@digipi: ~", wm_class="lxterminal.Lxterminal")
+    registry = windows.WindowRegistry(fake)
+
+    def expect(name, got, wanted, lists):
+        if got != wanted or fake.list_calls != lists:
+            problems.append(f"  {name}: got {got} after {fake.list_calls} lookups, "
+                            f"expected {wanted} after {lists}")
+
+    expect("rig A", registry.focus_jtdx("JTDX - rig A"), "0x1", 1)
+    expect("rig B", registry.focus_jtdx("WSJT-X - rig B"), "0x2", 2)
+    expect("rig A cached", registry.focus_jtdx("JTDX - rig A"), "0x1", 2)
+    fake.remove("0x1")
+    fake.add("0x4", "JTDX   by HF community - rig A")
+    expect("rig A restarted", registry.focus_jtdx("JTDX - rig A"), "0x4", 3)
+    expect("terminal", registry.focus_terminal(), ("0x3", "LXTerminal window (class match)"), 4)
+    fake.remove("0x2")
+    fake.remove("0x4")
+    expect("all closed", registry.focus_jtdx(), None, 5)
+    if fake.activated != ["0x1", "0x2", "0x1", "0x4", "0x3"]:
+        problems.append(f"  activated {fake.activated}")
+    return problems
+
+
+# ADIF log: one record per QSO
+
+def logged_once():
+    """The client's QSO Logged and the engine's own finish make one ADIF
+    record, whichever comes first.  Returns the problems found."""
+    problems = []
+    qso = [decode(10, "5Z4XB DL1ABC JO62")]
+    orders = {"logged before the finish": qso + [qso_logged(39.5, "DL1ABC"), decode(40, "5Z4XB DL1ABC RR73")],
+              "logged after the finish": qso + [decode(40, "5Z4XB DL1ABC RR73"), qso_logged(45, "DL1ABC")]}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, events in orders.items():
+            path = os.path.join(tmp, name.replace(" ", "_") + ".adi")
+            replay = Replay()
+            try:
+                replay.engine.log = qso_log.QsoLog(path, clock=replay.clock)
+                replay.feed(events, 60)
+                replay.engine.log.close()
+            finally:
+                replay.close()
+            with open(path, encoding="utf-8") as f:
+                records = [r for r in f.read().split("<EOR>") if "<CALL:6>DL1ABC" in r]
+            if len(records) != 1 or "<RST_SENT:" not in records[0]:
+                problems.append(f"  {name}: {len(records)} DL1ABC records, expected the client's one")
+    return problems
+
+
+# Instances coming and going
+
+def closed_instance():
+    """The only client sends Close: its machine goes, and status() still
+    works with no instance left.  Returns the problems found."""
+    problems = []
+    replay = Replay()
+    try:
+        replay.feed([decode(10, "5Z4XB DL1ABC JO62"), (20, proto.encode(proto.Close(CLIENT_ID)))], 30)
+        status = replay.engine.status()
+        if status['instances'] or status['qso_partner'] is not None:
+            problems.append(f"  closed instance still reported: {status['instances']}")
+    except Exception as e:
+        problems.append(f"  status() after Close: {e!r}")
+    finally:
+        replay.close()
+    return problems
+
+
+# State journal: a restart mid-countdown
+
+def resumed_after_restart():
+    """A crash while the post-QSO countdown runs: the next engine resumes
+    it from the journal and sends one Alt-N at the original due time, or
+    none if the client's Status already shows TX on.  Restarted after the
+    due time, the step runs at once, before any Status can show whether
+    the toggle went out: no Alt-N, and the engine (with a console attached)
+    starts regardless.  Returns the problems found."""
+    problems = []
+    post = engine.POST_QSO_TX_DELAY
+    crash = 50
+    late = 40 + post + 5
+    cases = {"TX off": (crash, [status(crash + 5, tx_enabled=False)], [(40 + post, "n")]),
+             "TX already on": (crash, [status(crash + 5, tx_enabled=True)], []),
+             "overdue": (late, [status(late + 5, tx_enabled=False)], [])}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, (restart, after, expected) in cases.items():
+            path = os.path.join(tmp, name.replace(" ", "_") + ".journal")
+            first = Replay()
+            try:
+                first.engine.open_journal(journal.Journal(path, clock=first.clock))
+                # Killed at `crash`: nothing closed, only the batched appends made
+                first.feed([decode(10, "5Z4XB DL1ABC JO62"), decode(40, "5Z4XB DL1ABC RR73")], crash)
+                if first.actions():
+                    problems.append(f"  {name}: {first.actions()} before the crash")
+            finally:
+                first.close()
+            with contextlib.redirect_stdout(io.StringIO()):
+                second = Replay(start=restart, verbose=True)
+                try:
+                    second.engine.open_journal(journal.Journal(path, clock=second.clock))
+                    assert_actions(second.feed(after, restart + 60), expected)
+                    if not second.engine.status()['instances']:
+                        problems.append(f"  {name}: the journaled instance was not resumed")
+                except Exception as e:
+                    problems.append(f"  {name}: {e!r}")
+                finally:
+                    second.close()
+    return problems
+
+
+# UDP control over loopback sockets
+
+SAMPLE_VALUES = {"u8": 1, "bool": True, "u32": 7, "i32": -7, "u64": 14074000, "f64": 0.25,
+                 "utf8": "DL1ABC", "qtime": 1234, "qdatetime": 1700000000}
+
+
+def udp_loopback():
+    """Every record survives encode() and parse(); then an engine driving
+    the UdpControlBackend (AUTOTX73_KEYS=udp) against a FakeWsjtxClient over
+    real sockets.  Returns the problems found."""
+    problems = []
+    for mtype, (record, kinds, _) in sorted(proto.SPECS.items()):
+        sample = record("WSJT-X", *(SAMPLE_VALUES[k] for k in kinds))
+        if proto.parse(proto.encode(sample)) != sample:
+            problems.append(f"  {record.__name__} does not round-trip")
+
+    server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    server.bind(("127.0.0.1", 0))
+    server.settimeout(1)
+    client = udp_control.FakeWsjtxClient(server.getsockname(), "WSJT-X")
+    replay = Replay()
+    backend = udp_control.UdpControlBackend()
+    keystrokes.set_backend(backend)
+    eng = replay.engine
+
+    def status(**fields):
+        client.send_status(de_call="5Z4XB", de_grid="KI03", **fields)
+        data, addr = server.recvfrom(8192)
+        eng.handle_datagram(data, addr, server)
+
+    def commands(until):
+        replay.advance(until)
+        return [c.record for c in client.poll(timeout=0.2)]
+
+    def expect(got, *wanted):
+        if got != list(wanted):
+            problems.append(f"  got {got}, expected {list(wanted)}")
+
+    try:
+        eng.enabled = False
+        status()
+        eng.enable()
+        expect(commands(0), proto.FreeText("WSJT-X", "CQ 5Z4XB KI03", False))
+        expect(commands(engine.ENABLE_TX_DELAY), proto.FreeText("WSJT-X", "CQ 5Z4XB KI03", True))
+        status(tx_enabled=client.tx_enabled)
+        eng.disable()
+        expect(commands(engine.ENABLE_TX_DELAY), proto.HaltTx("WSJT-X", True))
+        expect(commands(engine.ENABLE_TX_DELAY + engine.DISABLE_HALT_DELAY), proto.HaltTx("WSJT-X", False))
+        eng.send_key("configure", "Rx offset moved to 900 Hz", "WSJT-X", fields={'client_id': "WSJT-X", 'rx_df': 900})
+        got = commands(60)
+        if len(got) != 1 or not isinstance(got[0], proto.Configure) or got[0].rx_df != 900:
+            problems.append(f"  got {got}, expected a Configure with rx_df 900")
+    finally:
+        replay.close()
+        client.close()
+        server.close()
+    return problems
+
+
+# Web commands: who may key the transmitter
+
+def command_access():
+    """POST /command over loopback is applied when addressed to this host by
+    address or name, and refused for a rebound name, a page from another
+    host, or a GET.  Returns the problems found."""
+    problems = []
+    applied = []
+    server = status_http.StatusServer(status_http.StatusHub(), lambda action: applied.append(action) or "ok",
+                                      port=0, host="127.0.0.1")
+    server.start()
+    port = server.server_address[1]
+    cases = [("by address", "POST", {"Host": f"127.0.0.1:{port}"}, 200),
+             ("by name", "POST", {"Host": f"localhost:{port}"}, 200),
+             ("rebound name", "POST", {"Host": f"autotx73.attacker.example:{port}"}, 403),
+             ("page on another host", "POST", {"Host": f"127.0.0.1:{port}", "Origin": "http://attacker.example"}, 403),
+             ("GET", "GET", {"Host": f"127.0.0.1:{port}"}, 405)]
+    try:
+        for name, method, headers, expected in cases:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+            try:
+                conn.request(method, "/command?action=toggle", headers=headers)
+                got = conn.getresponse().status
+            finally:
+                conn.close()
+            if got != expected:
+                problems.append(f"  {name}: HTTP {got}, expected {expected}")
+        if applied != ["toggle", "toggle"]:
+            problems.append(f"  commands applied: {applied}, expected two toggles")
+    finally:
+        server.close()
+    return problems
+
+
+def selftest(verbose=False):
+    failed = 0
+    for name, events, until, expected, *options in scenarios():
+        actual = run(events, until, quiet=not verbose, **(options[0] if options else {}))
+        try:
+            assert_actions(actual, expected)
+            print(f"✅  {name}")
+        except AssertionError as e:
+            failed += 1
+            print(f"✘  {name}\n{e}")
+    for name, check in (("windows looked up once, again when gone", window_registry),
+                        ("QSO logged once in either order", logged_once),
+                        ("client closes, status still works", closed_instance),
+                        ("post-QSO countdown resumed after a restart", resumed_after_restart),
+                        ("UDP control loopback", udp_loopback),
+                        ("web commands only from this host", command_access)):
+        problems = check()
+        if problems:
+            failed += 1
+            print(f"✘  {name}\n" + "\n".join(problems))
+        else:
+            print(f"✅  {name}")
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay datagrams through the AutoTX73 engine")
+    parser.add_argument("capture", nargs="?")
+    parser.add_argument("--until", type=float, help="keep running to this many seconds")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the random break delay")
+    parser.add_argument("--selftest", action="store_true", help="run the built-in scenarios")
+    parser.add_argument("-v", "--verbose", action="store_true", help="show the engine's log")
+    args = parser.parse_args()
+    if args.selftest:
+        sys.exit(1 if selftest(args.verbose) else 0)
+    if not args.capture:
+        parser.error("a capture file or --selftest is required")
+    actions = run(load_capture(args.capture), args.until, args.seed, quiet=not args.verbose)
+    for when, key in actions:
+        print(f"{when:10.3f}s  Alt-{key.upper() if key.isalpha() else key}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+"""
+Embedded HTTP status server with Server-Sent Events
+
+Runs inside the AutoTX73 process so the web page no longer needs a CGI
+interpreter per poll:
+
+    GET  /           the control page (var/www/html/autotx73.html)
+    GET  /status     current status as JSON
+    GET  /events     text/event-stream, one event per status change
+    POST /command    action=enable|disable|toggle|quit
+    GET  /metrics    counters and histograms in Prometheus text format
+    GET  /metrics.json  the same as a compact JSON summary
+
+Commands key the transmitter, so they are POST only and accepted only from
+this machine or the addresses in AUTOTX73_COMMAND_HOSTS (comma separated),
+only when addressed to this machine by IP address or by its own name (a
+DNS-rebound name is refused), and never from pages on other hosts.  Only
+/status and /events may be read from anywhere.
+
+The server runs on its own threads; status is published from the loop thread
+into a StatusHub, and commands are handed back to the loop with
+call_soon_threadsafe().  StatusPublisher is the web front end of the engine:
+it follows the engine's event stream and publishes a snapshot on every change.
+"""
+
+import ipaddress
+import json
+import os
+import socket
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import metrics
+
+STATUS_HTTP_PORT = int(os.environ.get("AUTOTX73_HTTP_PORT", "8073"))
+STATUS_FILE = '/tmp/autotx73_status.json'
+COMMANDS = ('enable', 'disable', 'toggle', 'quit')
+COMMAND_HOSTS = {h.strip() for h in os.environ.get("AUTOTX73_COMMAND_HOSTS", "").split(",") if h.strip()}
+KEEPALIVE_INTERVAL = 15  # seconds between SSE comments on an idle stream
+COMMAND_TIMEOUT = 5  # seconds to wait for the loop to acknowledge a command
+
+_here = os.path.dirname(os.path.abspath(__file__))
+PAGE_PATHS = (
+    os.path.join(_here, 'var', 'www', 'html', 'autotx73.html'),
+    '/var/www/html/autotx73.html',
+)
+
+
+class StatusHub:
+    """Latest status snapshot plus a condition SSE clients wait on."""
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.version = 0
+        self.body = b"{}"
+
+    def publish(self, status):
+        """Store a new snapshot; returns True if it differs from the last."""
+        body = json.dumps(status).encode()
+        with self.cond:
+            if body == self.body:
+                return False
+            self.body = body
+            self.version += 1
+            self.cond.notify_all()
+        return True
+
+    def wait(self, version, timeout):
+        """Block until the snapshot is newer than `version` (or timeout)."""
+        with self.cond:
+            self.cond.wait_for(lambda: self.version != version, timeout)
+            return self.version, self.body
+
+
+def write_status_file(body, path=STATUS_FILE):
+    # Write-then-rename so readers never see a half-written file
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, 'wb') as f:
+            f.write(body)
+        os.replace(tmp, path)
+    except OSError:
+        pass
+
+
+class StatusPublisher:
+    """Publishes engine.status() plus the recent log lines to a StatusHub
+    and the status file, once per loop pass with changes and every second
+    (countdowns and the QSO timer move on their own)."""
+
+    def __init__(self, engine, hub, status_file=STATUS_FILE):
+        self.engine = engine
+        self.hub = hub
+        self.status_file = status_file
+        self.messages = deque(maxlen=10)
+        self.pending = False
+        engine.subscribe(self.on_event)
+        self.ticker = engine.loop.call_every(1, self.publish)
+
+    def on_event(self, event):
+        if event.kind == "log":
+            self.messages.append(f"[{time.strftime('%H:%M:%S')}] {event.fields['text']}")
+        if not self.pending:
+            self.pending = True
+            self.engine.loop.call_later(0, self.publish)
+
+    def publish(self):
+        self.pending = False
+        status = self.engine.status()
+        status['messages'] = list(self.messages)
+        # The file (for the CGI) is only rewritten on change
+        if self.hub.publish(status) and self.status_file:
+            write_status_file(self.hub.body, self.status_file)
+
+    def close(self):
+        self.ticker.cancel()
+        self.engine.unsubscribe(self.on_event)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "AutoTX73"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, code, body, ctype="application/json", origin=None, headers=()):
+        self.send_response(code)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-store")
+        if origin:
+            self.send_header("Access-Control-Allow-Origin", origin)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _trusted(self):
+        # The sender must be this machine or one the operator listed, and the
+        # request addressed to this machine, not to some name rebound onto it
+        client = ipaddress.ip_address(self.client_address[0])
+        client = getattr(client, "ipv4_mapped", None) or client
+        if not client.is_loopback and str(client) not in COMMAND_HOSTS:
+            return False
+        host = urlparse("//" + (self.headers.get("Host") or "")).hostname
+        if host is None:
+            return False
+        try:
+            ipaddress.ip_address(host)
+            return True
+        except ValueError:
+            return host in ("localhost", socket.gethostname().lower(), socket.getfqdn().lower())
+
+    def _same_host(self, origin):
+        # The page may come from the web server on port 80 of this host
+        host = urlparse("//" + (self.headers.get("Host") or "")).hostname
+        return urlparse(origin).hostname == host
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path in ("/", "/autotx73.html"):
+            self._page()
+        elif url.path == "/status":
+            self._send(200, self.server.hub.body, origin="*")
+        elif url.path == "/events":
+            self._events()
+        elif url.path == "/command":
+            self._send(405, b'{"error": "use POST"}', headers=[("Allow", "POST")])
+        elif url.path == "/metrics":
+            body = self.server.render_metrics()
+            if body is None:
+                self._send(503, b'{"error": "timeout"}')
+            else:
+                self._send(200, body.encode(), "text/plain; version=0.0.4")
+        elif url.path == "/metrics.json":
+            summary = self.server.render_metrics(as_json=True)
+            if summary is None:
+                self._send(503, b'{"error": "timeout"}')
+            else:
+                self._send(200, json.dumps(summary).encode())
+        else:
+            self._send(404, b'{"error": "not found"}')
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/command":
+            self._send(404, b'{"error": "not found"}')
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        form = parse_qs(self.rfile.read(length).decode(errors="replace"))
+        form.update(parse_qs(url.query))
+        origin = self.headers.get("Origin")
+        if not self._trusted():
+            self._send(403, b'{"error": "commands are not accepted from this host"}')
+            return
+        if origin and not self._same_host(origin):
+            self._send(403, b'{"error": "cross-site command refused"}')
+            return
+        self._command(form, origin)
+
+    def _page(self):
+        for path in PAGE_PATHS:
+            try:
+                with open(path, 'rb') as f:
+                    self._send(200, f.read(), "text/html; charset=utf-8")
+                    return
+            except OSError:
+                continue
+        self._send(404, b'{"error": "page not installed"}')
+
+    def _command(self, form, origin=None):
+        action = (form.get("action") or [None])[0]
+        if action not in COMMANDS:
+            self._send(400, json.dumps({'result': 'error', 'action': action}).encode(), origin=origin)
+            return
+        result = self.server.on_command(action)
+        self._send(200, json.dumps({'result': result, 'action': action}).encode(), origin=origin)
+
+    def _events(self):
+        hub = self.server.hub
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-store")
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.end_headers()
+        version, body = hub.version, hub.body
+        try:
+            self.wfile.write(b"data: " + body + b"\n\n")
+            self.wfile.flush()
+            while not self.server.closing:
+                new_version, body = hub.wait(version, KEEPALIVE_INTERVAL)
+                if new_version == version:
+                    self.wfile.write(b": keepalive\n\n")
+                else:
+                    version = new_version
+                    self.wfile.write(b"data: " + body + b"\n\n")
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+class StatusServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, hub, on_command, port=STATUS_HTTP_PORT, host="0.0.0.0", render_metrics=None):
+        super().__init__((host, port), _Handler)
+        self.hub = hub
+        self.on_command = on_command
+        self.render_metrics = render_metrics or (
+            lambda as_json=False: metrics.registry.snapshot() if as_json else metrics.registry.render())
+        self.closing = False
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+    def close(self):
+        self.closing = True
+        with self.hub.cond:
+            self.hub.cond.notify_all()
+        self.shutdown()
+        self.server_close()
+
+
+def start(loop, on_command, port=STATUS_HTTP_PORT):
+    """Start the server; commands run on `loop` via on_command(action),
+    which returns the result string sent back to the browser.
+
+    Returns (hub, server), or (hub, None) if the port cannot be bound.
+    """
+    hub = StatusHub()
+    loop.enable_threadsafe()
+
+    def on_loop(fn, *args):
+        # Run fn on the loop thread and wait for its result (None on timeout)
+        done = threading.Event()
+        result = []
+
+        def run():
+            try:
+                result.append(fn(*args))
+            finally:
+                done.set()
+        loop.call_soon_threadsafe(run)
+        if not done.wait(COMMAND_TIMEOUT):
+            return None
+        return result[0] if result else 'error'
+
+    def handle(action):
+        # Wait for the loop to apply it, so the reply is a real acknowledgement
+        result = on_loop(on_command, action)
+        return 'timeout' if result is None else result
+
+    def render_metrics(as_json=False):
+        # Metrics are only touched on the loop thread, and only when asked for
+        return on_loop(metrics.registry.snapshot if as_json else metrics.registry.render)
+    try:
+        server = StatusServer(hub, handle, port, render_metrics=render_metrics)
+    except OSError:
+        return hub, None
+    server.start()
+    return hub, server
@@ -3,19 +3,26 @@
 Toggle Enable Tx in JTDX / WSJT‑X (Alt+N) – VNC‑friendly
 """
 
-import subprocess, re, sys
+import subprocess, sys
+
+from command_channel import CommandError, send_command
+from windows import registry
 
 ALT_N = ["xte", "keydown Alt_L", "key n", "keyup Alt_L"]   # ⬅ no  -x  here
 
-def first_jtdx_window():
-    out = subprocess.check_output(["wmctrl", "-lx"]).decode()
-    for line in out.splitlines():
-        wid, *rest, title = line.split(None, 4)
-        if re.search(r"(JTDX|WSJT-X)", title, re.I):
-            return wid
-    return None
+# If AutoTX73 is running, let it send the toggle so it goes through its own
+# backend and in order with its other actions
+if len(sys.argv) == 1:
+    try:
+        reply = send_command("toggle")
+        print(f"✅  Alt‑N sent by AutoTX73 (command #{reply['seq']})")
+        sys.exit(0)
+    except CommandError as e:
+        sys.exit(f"✘  {e}")
+    except OSError:
+        pass
 
-wid = first_jtdx_window() if len(sys.argv) == 1 else sys.argv[1]
+wid = registry.jtdx_window() if len(sys.argv) == 1 else sys.argv[1]
 if not wid:
     sys.exit("✘  No JTDX / WSJT‑X window found")
 
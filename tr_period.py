@@ -0,0 +1,55 @@
+"""
+T/R period arithmetic
+
+FT8 and friends transmit in fixed periods counted from UTC midnight (every
+15 s for FT8, 7.5 s for FT4), and a station transmits in either the even or
+the odd ones.  The engine uses this to line actions up with our next TX
+period instead of firing a fixed number of seconds later: a TX enable that
+lands just after a period has started makes the client wait for the next
+one, and we lose a whole period.
+
+Periods are numbered from the Unix epoch, which is a whole number of days
+(and so of periods) before any UTC midnight; the parity of a period number
+is the even/odd of the clients' "Tx even/1st" setting.
+"""
+
+import math
+import os
+
+PERIODS = {"FT8": 15, "FT4": 7.5, "FST4": 60, "Q65": 60}
+DEFAULT_PERIOD = 15
+# Seconds before the period start at which an aligned action fires
+SLOT_MARGIN = float(os.environ.get("AUTOTX73_SLOT_MARGIN", "1.0"))
+SLOT_ALIGN = os.environ.get("AUTOTX73_SLOT_ALIGN", "1") not in ("", "0")
+
+
+def period_of(status):
+    """T/R period in seconds for a Status record (or None)."""
+    if status is None:
+        return DEFAULT_PERIOD
+    return PERIODS.get(status.mode) or status.tr_period or DEFAULT_PERIOD
+
+
+def slot_at(wall, period):
+    """Number of the period running at Unix time `wall`."""
+    return int(wall // period)
+
+
+def slot_of(time_ms, period, now):
+    """Number of the period a Decode belongs to: Decode.time_ms is the
+    period start in ms since UTC midnight, on today's date, or yesterday's
+    for decodes just before midnight."""
+    t = (now // 86400) * 86400 + time_ms / 1000
+    if t > now + 3600:
+        t -= 86400
+    return slot_at(t, period)
+
+
+def next_slot(wall, period, parity=None, margin=SLOT_MARGIN):
+    """First period we can still act `margin` seconds ahead of, of the given
+    parity (0 even, 1 odd) when known."""
+    n = math.ceil((wall + margin) / period)
+    if parity is not None and n % 2 != parity:
+        n += 1
+    return n
+
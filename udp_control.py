@@ -0,0 +1,186 @@
+"""
+Control JTDX / WSJT-X with the UDP protocol's inbound messages
+
+UdpControlBackend speaks the same send_alt() interface as the keystroke
+backends but answers each client at the address its datagrams come from, so
+an action is one datagram and needs no X display:
+
+    Alt-H  ->  HaltTx (halt now)
+    Alt-6  ->  FreeText "CQ <call> <grid>" (queued, not sent)
+    Alt-N  ->  HaltTx (auto only) when Enable Tx is on, otherwise FreeText
+               with send set, which enables TX with the CQ message
+
+FakeWsjtxClient is a stand-in client for running without a rig: it sends
+Status/Decode datagrams to a server and records the commands it receives.
+"""
+
+import socket
+import time
+from collections import namedtuple
+
+import wsjtx_protocol as proto
+
+
+class UdpControlBackend:
+    name = "udp"
+
+    def __init__(self, sock=None):
+        self.sock = sock
+        self.clients = {}  # client id -> address
+        self.status = {}  # client id -> last Status
+        self.sent = []  # (time, client id, record), for diagnostics
+
+    def observe(self, msg, addr, sock=None):
+        """Note where a client lives and its latest Status."""
+        if sock is not None:
+            self.sock = sock
+        if msg is None or msg.client_id is None:
+            return
+        self.clients[msg.client_id] = addr
+        if isinstance(msg, proto.Status):
+            self.status[msg.client_id] = msg
+        elif isinstance(msg, proto.Close):
+            self.clients.pop(msg.client_id, None)
+            self.status.pop(msg.client_id, None)
+
+    def _targets(self, client_id):
+        if client_id is not None:
+            return [client_id] if client_id in self.clients else []
+        return list(self.clients)
+
+    def send(self, record):
+        addr = self.clients.get(record.client_id)
+        if addr is None or self.sock is None:
+            return False
+        self.sock.sendto(proto.encode(record), addr)
+        self.sent.append((time.monotonic(), record.client_id, record))
+        return True
+
+    def cq_text(self, client_id):
+        status = self.status.get(client_id)
+        if status is None or not status.de_call:
+            return None
+        grid = (status.de_grid or "")[:4]
+        return f"CQ {status.de_call} {grid}".strip()
+
+    def halt_tx(self, client_id=None, auto_tx_only=False):
+        return self._each(client_id, lambda cid: proto.HaltTx(cid, auto_tx_only))
+
+    def free_text(self, text, send, client_id=None):
+        return self._each(client_id, lambda cid: proto.FreeText(cid, text, send))
+
+    def reply(self, decode, modifiers=0):
+        """Act as if the operator double-clicked `decode` (a Decode record)."""
+        return self.send(proto.Reply(
+            decode.client_id, decode.time_ms, decode.snr, decode.delta_time,
+            decode.delta_frequency, decode.mode, decode.message,
+            bool(decode.low_confidence), modifiers))
+
+    def configure(self, client_id=None, **fields):
+        """Send a Configure; fields left out are sent as "no change"."""
+        defaults = dict(mode=None, frequency_tolerance=0xFFFFFFFF, sub_mode=None,
+                        fast_mode=False, tr_period=0xFFFFFFFF, rx_df=0xFFFFFFFF,
+                        dx_call=None, dx_grid=None, generate_messages=False)
+        defaults.update(fields)
+        return self._each(client_id, lambda cid: proto.Configure(cid, **defaults))
+
+    def _each(self, client_id, build):
+        ok = False
+        for cid in self._targets(client_id):
+            ok = self.send(build(cid)) or ok
+        return ok
+
+    # Keystroke backend interface
+
+    def focus(self, client_id=None):
+        return bool(self._targets(client_id))
+
+    def press_alt(self, key, client_id=None):
+        if not self.send_alt(key, client_id):
+            raise RuntimeError("no WSJT-X client seen yet")
+
+    def send_alt(self, key, client_id=None):
+        ok = False
+        for cid in self._targets(client_id):
+            if key == "h":
+                ok = self.halt_tx(cid) or ok
+            elif key == "6":
+                text = self.cq_text(cid)
+                ok = bool(text) and self.free_text(text, False, cid) or ok
+            elif key == "n":
+                status = self.status.get(cid)
+                if status is not None and status.tx_enabled:
+                    ok = self.halt_tx(cid, auto_tx_only=True) or ok
+                else:
+                    text = self.cq_text(cid)
+                    ok = bool(text) and self.free_text(text, True, cid) or ok
+            else:
+                raise ValueError(f"no UDP equivalent for Alt-{key}")
+        return ok
+
+
+Command = namedtuple("Command", "time record")
+
+
+class FakeWsjtxClient:
+    """Stand-in WSJT-X client: sends datagrams to a server, records commands."""
+
+    def __init__(self, server=("127.0.0.1", 2237), client_id="WSJT-X",
+                 clock=time.monotonic):
+        self.server = server
+        self.client_id = client_id
+        self.clock = clock
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("127.0.0.1", 0))
+        self.commands = []
+        self.tx_enabled = False
+
+    @property
+    def address(self):
+        return self.sock.getsockname()
+
+    def send(self, record):
+        self.sock.sendto(proto.encode(record), self.server)
+
+    def send_status(self, **fields):
+        values = dict(dial_frequency=14074000, mode="FT8", dx_call="", report="",
+                      tx_mode="FT8", tx_enabled=self.tx_enabled,
+                      transmitting=False, decoding=False, rx_df=1500, tx_df=1500,
+                      de_call="N0CALL", de_grid="AA00", dx_grid="",
+                      tx_watchdog=False, sub_mode="", fast_mode=False,
+                      special_op_mode=0, frequency_tolerance=None,
+                      tr_period=None, configuration_name=None, tx_message=None)
+        values.update(fields)
+        self.send(proto.Status(self.client_id, **values))
+
+    def send_decode(self, message, snr=-10, delta_time=0.1, delta_frequency=1500,
+                    time_ms=None, new=True):
+        if time_ms is None:
+            time_ms = int(time.time() % 86400 * 1000)
+        self.send(proto.Decode(self.client_id, new, time_ms, snr, delta_time,
+                               delta_frequency, "~", message, False, False))
+
+    def poll(self, timeout=0.0):
+        """Receive pending commands; apply HaltTx/FreeText to tx_enabled."""
+        self.sock.settimeout(timeout)
+        received = []
+        while True:
+            try:
+                data = self.sock.recv(4096)
+            except (socket.timeout, BlockingIOError):
+                break
+            record = proto.parse(data)
+            if record is None:
+                continue
+            if isinstance(record, proto.HaltTx):
+                self.tx_enabled = False
+            elif isinstance(record, proto.FreeText) and record.send:
+                self.tx_enabled = True
+            cmd = Command(self.clock(), record)
+            self.commands.append(cmd)
+            received.append(cmd)
+            self.sock.settimeout(0)
+        return received
+
+    def close(self):
+        self.sock.close()
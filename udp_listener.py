@@ -0,0 +1,263 @@
+"""
+UDP intake shared by the headless script and the curses UI
+
+By default the WSJT-X port is bound for unicast/broadcast as before, which
+keeps it to one listener.  With AUTOTX73_MULTICAST set to a group address
+(configure the same group as the UDP server in JTDX / WSJT-X) the socket is
+bound with SO_REUSEADDR/SO_REUSEPORT and joins the group, so GridTracker,
+JTAlert, a logger, autotx73.py and autotx73_ui.py can all listen at once.
+Address reuse is only turned on for multicast: for unicast datagrams the
+kernel would hand each one to a single socket and silently split the stream.
+
+AUTOTX73_RELAY ("host:port,host:port") forwards every received datagram
+unchanged to those endpoints, for programs that only take unicast.  Commands
+the downstream programs send back are not passed on to JTDX / WSJT-X.
+
+JTDX sends a slot's decodes in a burst of a few hundred milliseconds, so
+the socket gets a large receive buffer (AUTOTX73_RCVBUF) and an Intake
+thread does nothing but read it: each datagram goes into one of a fixed set
+of preallocated slots, and a bounded queue hands the slots to the loop,
+which is woken once per batch rather than once per packet.  File writes,
+rendering or a slow keystroke on the loop thread therefore never leave the
+kernel queue unread.  When every slot is waiting, that is counted in
+`overflows` and the thread waits for the loop to free one, leaving the
+datagrams in the kernel buffer rather than dropping them.  Handlers get memoryview slices of the slots, so
+neither the relay nor the handlers copy a packet; a handler that needs to
+keep one must take bytes() of it.
+
+On Linux the socket also asks for SO_RXQ_OVFL: every datagram then carries
+the kernel's count of datagrams dropped because the receive queue was full,
+which the Intake keeps in `dropped`.
+"""
+
+import os
+import socket
+import struct
+import sys
+import threading
+from collections import deque
+
+MULTICAST_GROUP = os.environ.get("AUTOTX73_MULTICAST")  # e.g. 239.255.0.73
+MULTICAST_IF = os.environ.get("AUTOTX73_MULTICAST_IF", "0.0.0.0")
+RELAY_TO = os.environ.get("AUTOTX73_RELAY", "")
+MAX_DATAGRAM = 65535
+RCVBUF = int(os.environ.get("AUTOTX73_RCVBUF", str(4 * 1024 * 1024)))
+QUEUE_SLOTS = 256  # datagrams the loop may fall behind by
+SLOT_SIZE = 8192  # WSJT-X messages are well under 2 KB; bigger ones are counted and dropped
+POLL_INTERVAL = 0.5  # seconds the intake thread waits before checking for stop()
+# Not exported by the socket module; Linux only
+SO_RXQ_OVFL = getattr(socket, "SO_RXQ_OVFL", 40)
+_OVFL = struct.Struct("=I")
+
+
+def parse_endpoints(spec):
+    """"host:port,host:port" -> [(host, port), ...]"""
+    endpoints = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        host, _, port = item.rpartition(":")
+        endpoints.append((host or "127.0.0.1", int(port)))
+    return endpoints
+
+
+def open_listener(port, group=MULTICAST_GROUP, interface=MULTICAST_IF):
+    """Non-blocking UDP socket for the WSJT-X stream on `port`."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        if group:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if hasattr(socket, "SO_REUSEPORT"):
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            sock.bind(("", port))
+            mreq = struct.pack("4s4s", socket.inet_aton(group), socket.inet_aton(interface))
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+        else:
+            sock.bind(("0.0.0.0", port))
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        set_receive_buffer(sock, RCVBUF)
+        sock.setblocking(False)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+def set_receive_buffer(sock, size):
+    """Ask for a `size` byte receive buffer; returns what the kernel gave.
+    Beyond net.core.rmem_max only root gets it (SO_RCVBUFFORCE)."""
+    for option in (getattr(socket, "SO_RCVBUFFORCE", None), socket.SO_RCVBUF):
+        if option is None:
+            continue
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, option, size)
+            break
+        except OSError:
+            continue
+    return sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+
+
+def count_overflows(sock):
+    """Turn on SO_RXQ_OVFL; False where the platform lacks it."""
+    if not sys.platform.startswith("linux"):
+        return False
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, SO_RXQ_OVFL, 1)
+    except OSError:
+        return False
+    return True
+
+
+def describe_listener(port, group=MULTICAST_GROUP):
+    if group:
+        return f"multicast {group}:{port}"
+    return f"0.0.0.0:{port} (broadcast enabled)"
+
+
+class Relay:
+    """Forwards datagrams unchanged to a fixed list of endpoints."""
+
+    def __init__(self, destinations):
+        self.destinations = list(destinations)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+        self.forwarded = 0
+        self.errors = 0  # sends refused or dropped (downstream gone, buffer full)
+
+    def forward(self, data):
+        sendto = self.sock.sendto
+        for dest in self.destinations:
+            try:
+                sendto(data, dest)
+            except OSError:
+                self.errors += 1
+        self.forwarded += 1
+
+    def close(self):
+        self.sock.close()
+
+
+def relay_from_env():
+    """A Relay if AUTOTX73_RELAY lists endpoints, else None."""
+    destinations = parse_endpoints(RELAY_TO)
+    return Relay(destinations) if destinations else None
+
+
+class Intake:
+    """Receive thread plus a bounded queue of preallocated slots.
+
+    The thread reads datagrams into free slots and queues them; the loop
+    runs process() once per batch, which passes each datagram to the relay
+    and the capture (if any) and then to handle(data, addr, sock) as a
+    memoryview that is only valid during the call.
+    """
+
+    def __init__(self, sock, loop, handle, relay=None, recorder=None, overflow=False,
+                 slots=QUEUE_SLOTS, slot_size=SLOT_SIZE):
+        self.sock = sock
+        self.loop = loop
+        self.handle = handle
+        self.relay = relay
+        self.recorder = recorder
+        self.slot_size = slot_size
+        self.rcvbuf = sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+        self.arena = bytearray(slots * slot_size)
+        view = memoryview(self.arena)
+        self.slots = [view[i * slot_size:(i + 1) * slot_size] for i in range(slots)]
+        # Both deques are only appended to on the right and popped on the
+        # left; append() and popleft() are atomic, so the two threads share
+        # them without a lock (a slot not used is handed back with append())
+        self.free = deque(range(slots))
+        self.ready = deque()  # (slot, length, addr)
+        self.scheduled = False  # a process() call is pending on the loop
+        self.space = threading.Event()  # set when process() frees slots
+        self.stopping = False
+        self.received = 0
+        self.batches = 0
+        self.peak = 0  # most datagrams queued at once
+        self.overflows = 0  # times every slot was queued
+        self.oversize = 0  # dropped because they did not fit a slot
+        # With count_overflows() on the socket, read the drop count too
+        self.overflow = overflow
+        self.dropped = 0
+        self.anc_size = socket.CMSG_SPACE(_OVFL.size) if overflow else 0
+        loop.enable_threadsafe()
+        self.thread = threading.Thread(target=self.run, name="udp-intake", daemon=True)
+
+    def start(self):
+        self.sock.settimeout(POLL_INTERVAL)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopping = True
+        self.space.set()
+        self.thread.join(POLL_INTERVAL * 2)
+
+    @property
+    def depth(self):
+        return len(self.ready)
+
+    # Intake thread
+
+    def run(self):
+        recvmsg_into = self.sock.recvmsg_into
+        anc_size = self.anc_size
+        ready = self.ready
+        while not self.stopping:
+            try:
+                slot = self.free.popleft()
+            except IndexError:
+                # The loop is behind: let the kernel buffer hold the rest
+                self.overflows += 1
+                self.space.clear()
+                if not self.free:
+                    self.space.wait(POLL_INTERVAL)
+                continue
+            try:
+                n, ancdata, flags, addr = recvmsg_into([self.slots[slot]], anc_size)
+            except socket.timeout:
+                self.free.append(slot)
+                continue
+            except OSError:
+                break  # socket closed
+            for level, kind, value in ancdata:
+                if level == socket.SOL_SOCKET and kind == SO_RXQ_OVFL:
+                    self.dropped = _OVFL.unpack_from(value)[0]
+            self.received += 1
+            if flags & socket.MSG_TRUNC:
+                self.oversize += 1
+                self.free.append(slot)
+                continue
+            ready.append((slot, n, addr))
+            if len(ready) > self.peak:
+                self.peak = len(ready)
+            # One wakeup per batch: process() clears the flag before it
+            # drains, so a datagram queued after that schedules another
+            if not self.scheduled:
+                self.scheduled = True
+                self.loop.call_soon_threadsafe(self.process)
+
+    # Loop thread
+
+    def process(self):
+        self.scheduled = False
+        ready, slots, sock = self.ready, self.slots, self.sock
+        count = 0
+        while ready:
+            slot, n, addr = ready.popleft()
+            data = slots[slot][:n]
+            try:
+                if self.relay:
+                    self.relay.forward(data)
+                if self.recorder:
+                    self.recorder.record(data)
+                self.handle(data, addr, sock)
+            finally:
+                self.free.append(slot)
+            count += 1
+        if count:
+            self.batches += 1
+            self.space.set()
+        return count
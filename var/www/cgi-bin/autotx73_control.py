@@ -3,21 +3,39 @@ import cgi
 import cgitb
 import json
 import os
+import socket
 
 cgitb.enable()
 status_file = '/tmp/autotx73_status.json'
-command_file = '/tmp/autotx73_command.txt'
+command_socket = '/tmp/autotx73.sock'
 
 print("Content-Type: application/json\n")
 
 form = cgi.FieldStorage()
 action = form.getvalue('action')
 
+def send_command(action):
+    # Same line protocol as command_channel.py; the reply is sent once the
+    # running AutoTX73 process has applied the command
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.settimeout(5)
+        s.connect(command_socket)
+        s.sendall(json.dumps({'id': os.getpid(), 'action': action}).encode() + b"\n")
+        buf = b""
+        while not buf.endswith(b"\n"):
+            chunk = s.recv(4096)
+            if not chunk:
+                break
+            buf += chunk
+    return json.loads(buf)
+
 # Handle control commands
-if action in ['enable', 'disable', 'quit']:
-    with open(command_file, 'w') as f:
-        f.write(action)
-    print(json.dumps({'result': 'ok', 'action': action}))
+if action in ['enable', 'disable', 'toggle', 'quit']:
+    try:
+        reply = send_command(action)
+        print(json.dumps({'result': reply.get('result'), 'action': action, 'seq': reply.get('seq')}))
+    except (OSError, ValueError) as e:
+        print(json.dumps({'result': 'error', 'action': action, 'error': str(e)}))
     exit(0)
 
 # Return status
@@ -0,0 +1,211 @@
+"""
+Cached registry of the JTDX / WSJT-X window and our own terminal window
+
+Looking windows up means forking wmctrl (and walking the process tree for the
+terminal), so the registry does it once and keeps the ids until they go stale:
+either the window manager's client list changes (watched through X property
+events when python-xlib is available) or activating a cached id fails, which
+triggers one fresh lookup.
+"""
+
+import os
+import re
+import subprocess
+from collections import namedtuple
+
+Window = namedtuple("Window", "wid pid wm_class title")
+
+JTDX_TITLE = re.compile(r"(JTDX|WSJT-X)", re.I)
+TERMINAL_CLASS = "lxterminal.lxterminal"
+TERMINAL_TITLE = "pi@digipi"
+
+
+class WmctrlBackend:
+    """Lists and activates windows through the wmctrl command."""
+
+    def list_windows(self):
+        out = subprocess.check_output(["wmctrl", "-lpx"]).decode(errors="replace")
+        windows = []
+        for line in out.splitlines():
+            parts = line.split(None, 5)
+            if len(parts) < 5:
+                continue
+            wid, _desktop, pid, wm_class = parts[:4]
+            title = parts[5] if len(parts) > 5 else ""
+            windows.append(Window(wid, pid, wm_class, title))
+        return windows
+
+    def activate(self, wid):
+        return subprocess.call(["wmctrl", "-ia", wid]) == 0
+
+
+class FakeBackend:
+    """In-memory window list for running headless (tests, replay)."""
+
+    def __init__(self, windows=()):
+        self.windows = {w.wid: w for w in windows}
+        self.activated = []
+        self.list_calls = 0
+
+    def add(self, wid, title, wm_class="jtdx.JTDX", pid="0"):
+        self.windows[wid] = Window(wid, pid, wm_class, title)
+
+    def remove(self, wid):
+        self.windows.pop(wid, None)
+
+    def list_windows(self):
+        self.list_calls += 1
+        return list(self.windows.values())
+
+    def activate(self, wid):
+        if wid not in self.windows:
+            return False
+        self.activated.append(wid)
+        return True
+
+
+def _ancestor_pids(pid):
+    # Walk /proc instead of psutil; the result is cached with the window id
+    pids = []
+    while pid > 1:
+        pids.append(pid)
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                stat = f.read()
+        except OSError:
+            break
+        # "pid (comm) state ppid ..." -- comm may contain spaces
+        pid = int(stat.rsplit(")", 1)[1].split()[1])
+    return pids
+
+
+def _rig_name(client_id):
+    # Instances started with --rig-name=X report client id "WSJT-X - X" (or
+    # "JTDX - X") and carry the rig name in their window title
+    if client_id and " - " in client_id:
+        return client_id.split(" - ", 1)[1]
+    return None
+
+
+class WindowRegistry:
+    def __init__(self, backend=None):
+        self.backend = backend or WmctrlBackend()
+        self._jtdx = {}  # client id (None = any instance) -> window id
+        self._terminal = None  # (wid, how it was found)
+        self.lookups = 0
+        self.watcher = None
+
+    def invalidate(self):
+        self._jtdx = {}
+        self._terminal = None
+
+    def _list(self):
+        self.lookups += 1
+        try:
+            return self.backend.list_windows()
+        except Exception:
+            return []
+
+    def jtdx_window(self, client_id=None):
+        """Window id of the JTDX / WSJT-X instance for `client_id` (or any)."""
+        wid = self._jtdx.get(client_id)
+        if wid is None:
+            rig = _rig_name(client_id)
+            for w in self._list():
+                if JTDX_TITLE.search(w.title) and (rig is None or rig in w.title):
+                    wid = self._jtdx[client_id] = w.wid
+                    break
+        return wid
+
+    def terminal_window(self):
+        """Return (wid, how) for the terminal running this process, or None."""
+        if self._terminal is None:
+            self._terminal = self._find_terminal(self._list())
+        return self._terminal
+
+    def _find_terminal(self, windows):
+        # 1. By window class (lxterminal.LXterminal)
+        for w in windows:
+            if w.wm_class.lower() == TERMINAL_CLASS:
+                return w.wid, "LXTerminal window (class match)"
+        # 2. By window title substring (pi@digipi)
+        for w in windows:
+            if TERMINAL_TITLE in w.title:
+                return w.wid, "LXTerminal window (title match)"
+        # 3. Any ancestor process that owns a window
+        for pid in _ancestor_pids(os.getpid()):
+            for w in windows:
+                if w.pid == str(pid):
+                    return w.wid, "terminal window (PID match)"
+        # 4. By TERM env
+        term = os.environ.get("TERM_PROGRAM") or os.environ.get("TERM") or "Terminal"
+        for w in windows:
+            if term in w.title or term in w.wm_class:
+                return w.wid, "terminal window (env fallback)"
+        return None
+
+    def _activate(self, lookup):
+        # Activating a stale id is the liveness check: on failure forget the
+        # cache and look the window up once more
+        for attempt in range(2):
+            found = lookup()
+            if not found:
+                return None
+            wid = found if isinstance(found, str) else found[0]
+            try:
+                if self.backend.activate(wid):
+                    return found
+            except Exception:
+                pass
+            self.invalidate()
+        return None
+
+    def focus_jtdx(self, client_id=None):
+        """Give the JTDX window focus and return its id, or None."""
+        return self._activate(lambda: self.jtdx_window(client_id))
+
+    def focus_terminal(self):
+        """Give our terminal focus and return (wid, how), or None."""
+        return self._activate(self.terminal_window)
+
+    def attach(self, loop):
+        """Invalidate when windows come and go, if python-xlib is usable."""
+        try:
+            self.watcher = XEventWatcher(self)
+        except Exception:
+            self.watcher = None
+            return False
+        loop.add_reader(self.watcher, lambda _: self.watcher.drain())
+        return True
+
+
+class XEventWatcher:
+    """Invalidates the registry whenever _NET_CLIENT_LIST on the root changes.
+
+    The window manager updates that property when a managed window is mapped
+    or destroyed, so menus and tooltips don't cause needless lookups.
+    """
+
+    def __init__(self, registry, display=None):
+        from Xlib import X, display as xdisplay
+        self.X = X
+        self.registry = registry
+        self.display = display or xdisplay.Display()
+        self.client_list = self.display.intern_atom("_NET_CLIENT_LIST")
+        root = self.display.screen().root
+        root.change_attributes(event_mask=X.PropertyChangeMask)
+        self.display.flush()
+
+    def fileno(self):
+        return self.display.fileno()
+
+    def drain(self):
+        X = self.X
+        while self.display.pending_events():
+            event = self.display.next_event()
+            if event.type == X.PropertyNotify and event.atom == self.client_list:
+                self.registry.invalidate()
+
+
+# Shared by the scripts in this directory
+registry = WindowRegistry()
@@ -0,0 +1,305 @@
+"""
+WSJT-X / JTDX UDP message codec (QDataStream wire format)
+
+Every datagram starts with a fixed header: magic, schema, message type and the
+client id.  peek_header() reads only that much, so packets we do not care about
+can be dropped without touching the payload; parse() decodes the payload of
+known types into small typed records and encode() turns a record back into a
+datagram (used for the inbound control messages and by the fake client).
+"""
+
+import struct
+from collections import namedtuple
+
+MAGIC = 0xADBCCBDA
+# Schema we write; every field we encode is the same in schemas 2 and 3
+SCHEMA = 2
+
+# Message types
+HEARTBEAT = 0
+STATUS = 1
+DECODE = 2
+CLEAR = 3
+REPLY = 4
+QSO_LOGGED = 5
+CLOSE = 6
+REPLAY = 7
+HALT_TX = 8
+FREE_TEXT = 9
+WSPR_DECODE = 10
+LOCATION = 11
+LOGGED_ADIF = 12
+HIGHLIGHT_CALLSIGN = 13
+SWITCH_CONFIGURATION = 14
+CONFIGURE = 15
+
+TYPE_NAMES = {
+    HEARTBEAT: "Heartbeat", STATUS: "Status", DECODE: "Decode", CLEAR: "Clear",
+    REPLY: "Reply", QSO_LOGGED: "QSOLogged", CLOSE: "Close", REPLAY: "Replay",
+    HALT_TX: "HaltTx", FREE_TEXT: "FreeText", WSPR_DECODE: "WSPRDecode",
+    LOCATION: "Location", LOGGED_ADIF: "LoggedADIF",
+    HIGHLIGHT_CALLSIGN: "HighlightCallsign",
+    SWITCH_CONFIGURATION: "SwitchConfiguration", CONFIGURE: "Configure",
+}
+
+_U8 = struct.Struct(">B")
+_U32 = struct.Struct(">I")
+_I32 = struct.Struct(">i")
+_U64 = struct.Struct(">Q")
+_I64 = struct.Struct(">q")
+_F64 = struct.Struct(">d")
+_HEADER = struct.Struct(">III")
+_NULL_LEN = 0xFFFFFFFF
+_JULIAN_EPOCH = 2440588  # julian day number of 1970-01-01
+
+Header = namedtuple("Header", "schema type client_id offset")
+
+# type -> (record class, field kinds, number of fields every sender includes)
+SPECS = {}
+_RECORD_TYPES = {}
+
+
+def _message(name, mtype, fields, required=None):
+    names = [f[0] for f in fields]
+    record = namedtuple(name, ["client_id"] + names)
+    kinds = tuple(f[1] for f in fields)
+    SPECS[mtype] = (record, kinds, len(kinds) if required is None else required)
+    _RECORD_TYPES[record] = mtype
+    return record
+
+
+Heartbeat = _message("Heartbeat", HEARTBEAT, [
+    ("max_schema", "u32"), ("version", "utf8"), ("revision", "utf8"),
+], required=1)
+# Older clients (and JTDX) leave off some of the trailing Status fields
+Status = _message("Status", STATUS, [
+    ("dial_frequency", "u64"), ("mode", "utf8"), ("dx_call", "utf8"),
+    ("report", "utf8"), ("tx_mode", "utf8"), ("tx_enabled", "bool"),
+    ("transmitting", "bool"), ("decoding", "bool"), ("rx_df", "u32"),
+    ("tx_df", "u32"), ("de_call", "utf8"), ("de_grid", "utf8"),
+    ("dx_grid", "utf8"), ("tx_watchdog", "bool"), ("sub_mode", "utf8"),
+    ("fast_mode", "bool"), ("special_op_mode", "u8"),
+    ("frequency_tolerance", "u32"), ("tr_period", "u32"),
+    ("configuration_name", "utf8"), ("tx_message", "utf8"),
+], required=15)
+Decode = _message("Decode", DECODE, [
+    ("new", "bool"), ("time_ms", "qtime"), ("snr", "i32"),
+    ("delta_time", "f64"), ("delta_frequency", "u32"), ("mode", "utf8"),
+    ("message", "utf8"), ("low_confidence", "bool"), ("off_air", "bool"),
+], required=7)
+Clear = _message("Clear", CLEAR, [("window", "u8")], required=0)
+Reply = _message("Reply", REPLY, [
+    ("time_ms", "qtime"), ("snr", "i32"), ("delta_time", "f64"),
+    ("delta_frequency", "u32"), ("mode", "utf8"), ("message", "utf8"),
+    ("low_confidence", "bool"), ("modifiers", "u8"),
+], required=7)
+QsoLogged = _message("QsoLogged", QSO_LOGGED, [
+    ("time_off", "qdatetime"), ("dx_call", "utf8"), ("dx_grid", "utf8"),
+    ("tx_frequency", "u64"), ("mode", "utf8"), ("report_sent", "utf8"),
+    ("report_received", "utf8"), ("tx_power", "utf8"), ("comments", "utf8"),
+    ("name", "utf8"), ("time_on", "qdatetime"), ("operator_call", "utf8"),
+    ("my_call", "utf8"), ("my_grid", "utf8"), ("exchange_sent", "utf8"),
+    ("exchange_received", "utf8"), ("adif_propagation_mode", "utf8"),
+], required=11)
+Close = _message("Close", CLOSE, [])
+Replay = _message("Replay", REPLAY, [])
+HaltTx = _message("HaltTx", HALT_TX, [("auto_tx_only", "bool")])
+FreeText = _message("FreeText", FREE_TEXT, [("text", "utf8"), ("send", "bool")])
+LoggedAdif = _message("LoggedAdif", LOGGED_ADIF, [("adif", "utf8")])
+Configure = _message("Configure", CONFIGURE, [
+    ("mode", "utf8"), ("frequency_tolerance", "u32"), ("sub_mode", "utf8"),
+    ("fast_mode", "bool"), ("tr_period", "u32"), ("rx_df", "u32"),
+    ("dx_call", "utf8"), ("dx_grid", "utf8"), ("generate_messages", "bool"),
+])
+
+
+class ProtocolError(ValueError):
+    pass
+
+
+class _Reader:
+    __slots__ = ("buf", "pos")
+
+    def __init__(self, buf, pos=0):
+        self.buf = buf
+        self.pos = pos
+
+    def _unpack(self, st):
+        try:
+            value, = st.unpack_from(self.buf, self.pos)
+        except struct.error:
+            raise ProtocolError("truncated message") from None
+        self.pos += st.size
+        return value
+
+    def u8(self):
+        return self._unpack(_U8)
+
+    def bool(self):
+        return self._unpack(_U8) != 0
+
+    def u32(self):
+        return self._unpack(_U32)
+
+    def i32(self):
+        return self._unpack(_I32)
+
+    def u64(self):
+        return self._unpack(_U64)
+
+    def f64(self):
+        return self._unpack(_F64)
+
+    def utf8(self):
+        n = self._unpack(_U32)
+        if n == _NULL_LEN:
+            return None
+        end = self.pos + n
+        if end > len(self.buf):
+            raise ProtocolError("truncated string")
+        s = bytes(self.buf[self.pos:end]).decode("utf-8", errors="replace")
+        self.pos = end
+        return s
+
+    def qtime(self):
+        # milliseconds since midnight, 0xffffffff for a null QTime
+        ms = self._unpack(_U32)
+        return None if ms == _NULL_LEN else ms
+
+    def qdatetime(self):
+        # (julian day, ms since midnight, timespec[, offset]) -> unix seconds
+        jd = self._unpack(_I64)
+        ms = self.qtime()
+        spec = self.u8()
+        offset = 0
+        if spec == 2:
+            offset = self.i32()
+        elif spec == 3:
+            self.utf8()  # IANA zone id, not needed here
+        if ms is None or jd == 0:
+            return None
+        return (jd - _JULIAN_EPOCH) * 86400 + ms / 1000.0 - offset
+
+    def remaining(self):
+        return len(self.buf) - self.pos
+
+
+class _Writer:
+    __slots__ = ("parts",)
+
+    def __init__(self):
+        self.parts = []
+
+    def u8(self, v):
+        self.parts.append(_U8.pack(v))
+
+    def bool(self, v):
+        self.parts.append(_U8.pack(1 if v else 0))
+
+    def u32(self, v):
+        self.parts.append(_U32.pack(v))
+
+    def i32(self, v):
+        self.parts.append(_I32.pack(v))
+
+    def u64(self, v):
+        self.parts.append(_U64.pack(v))
+
+    def f64(self, v):
+        self.parts.append(_F64.pack(v))
+
+    def utf8(self, v):
+        if v is None:
+            self.parts.append(_U32.pack(_NULL_LEN))
+            return
+        b = v.encode("utf-8")
+        self.parts.append(_U32.pack(len(b)))
+        self.parts.append(b)
+
+    def qtime(self, v):
+        self.u32(_NULL_LEN if v is None else int(v))
+
+    def qdatetime(self, v):
+        if v is None:
+            self.parts.append(_I64.pack(0))
+            self.qtime(None)
+        else:
+            days, secs = divmod(v, 86400)
+            self.parts.append(_I64.pack(int(days) + _JULIAN_EPOCH))
+            self.qtime(int(secs * 1000))
+        self.u8(1)  # Qt::UTC
+
+    def getvalue(self):
+        return b"".join(self.parts)
+
+
+def peek_header(data):
+    """Return the Header of a datagram, or None if it is not a WSJT-X message."""
+    try:
+        magic, schema, mtype = _HEADER.unpack_from(data, 0)
+    except struct.error:
+        return None
+    if magic != MAGIC:
+        return None
+    r = _Reader(data, _HEADER.size)
+    try:
+        client_id = r.utf8()
+    except ProtocolError:
+        return None
+    return Header(schema, mtype, client_id, r.pos)
+
+
+def message_type(data):
+    """Message type number of a datagram, or None if it is not a WSJT-X
+    message; cheaper than peek_header() as the client id is not read."""
+    try:
+        magic, _, mtype = _HEADER.unpack_from(data, 0)
+    except struct.error:
+        return None
+    return mtype if magic == MAGIC else None
+
+
+def parse(data, types=None):
+    """Decode a datagram into a typed record.
+
+    Returns None for foreign packets, for message types without a record and
+    for types not listed in `types` (when given).  Only the header is read for
+    skipped messages.  Raises ProtocolError on a truncated payload.
+    """
+    header = peek_header(data)
+    if header is None:
+        return None
+    if types is not None and header.type not in types:
+        return None
+    spec = SPECS.get(header.type)
+    if spec is None:
+        return None
+    record, kinds, required = spec
+    r = _Reader(data, header.offset)
+    fields = []
+    for i, kind in enumerate(kinds):
+        if i >= required and not r.remaining():
+            break
+        fields.append(getattr(r, kind)())
+    fields.extend([None] * (len(kinds) - len(fields)))
+    return record(header.client_id, *fields)
+
+
+def encode(msg, schema=SCHEMA):
+    """Encode a record into a datagram.
+
+    Optional trailing fields left as None are not written, so a record parsed
+    from an older client encodes back to the same layout.
+    """
+    mtype = _RECORD_TYPES[type(msg)]
+    _, kinds, required = SPECS[mtype]
+    w = _Writer()
+    w.parts.append(_HEADER.pack(MAGIC, schema, mtype))
+    w.utf8(msg.client_id)
+    values = msg[1:]
+    end = len(kinds)
+    while end > required and values[end - 1] is None:
+        end -= 1
+    for kind, value in zip(kinds[:end], values[:end]):
+        getattr(w, kind)(value)
+    return w.getvalue()